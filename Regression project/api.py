@@ -0,0 +1,249 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+import metrics
+from batch import BatchValidationError, validate
+from formatting import format_indian_number
+from model import FEATURES, load_model
+from prediction_cache import normalize, prediction_cache
+
+DEFAULT_MAX_BATCH_SIZE = 256
+DEFAULT_MAX_WAIT_MS = 5
+MAX_BODY_BYTES = 10 * 1024 * 1024
+_STOP = object()
+
+
+class MicroBatcher:
+    # Coalesces requests that arrive within max_wait seconds into a single
+    # predict call on a stacked DataFrame (up to max_batch_size rows)
+
+    def __init__(
+        self,
+        max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+        max_wait=DEFAULT_MAX_WAIT_MS / 1000,
+        loader=load_model,
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.loader = loader
+        self.batches = 0
+        self.rows = 0
+        self._queue = queue.Queue()
+        self._pending = None
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, frame):
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((frame, future))
+        return future
+
+    def predict(self, frame, timeout=None):
+        return self.submit(frame).result(timeout)
+
+    def close(self):
+        self._closed = True
+        self._queue.put(_STOP)
+        self._worker.join()
+
+    def _collect(self):
+        # Blocks for the first request, then gathers more until the batch is
+        # full or max_wait has passed since the first one arrived
+        if self._pending is not None:
+            item, self._pending = self._pending, None
+        else:
+            item = self._queue.get()
+        if item is _STOP:
+            return None
+        batch = [item]
+        size = len(item[0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP or size + len(item[0]) > self.max_batch_size:
+                # Goes first in the next batch (or stops the worker)
+                self._pending = item
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            frames = [frame for frame, _ in batch]
+            try:
+                pipe, meta = self.loader()
+                with metrics.timer("api_batch_predict_seconds"):
+                    prices = pipe.predict(pd.concat(frames, ignore_index=True))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.rows += len(prices)
+            metrics.count("api_predicted_rows_total", len(prices))
+            offset = 0
+            for frame, future in batch:
+                future.set_result((prices[offset : offset + len(frame)], meta))
+                offset += len(frame)
+
+
+def parse_rows(payload):
+    # Accepts a single listing object, a list of listings or {"rows": [...]}
+    if isinstance(payload, dict) and "rows" in payload:
+        rows, single = payload["rows"], False
+    elif isinstance(payload, list):
+        rows, single = payload, False
+    elif isinstance(payload, dict):
+        rows, single = [payload], True
+    else:
+        raise BatchValidationError("Expected a listing object or a list of listings")
+    if not rows or not all(isinstance(row, dict) for row in rows):
+        raise BatchValidationError("Listings must be a non-empty list of objects")
+
+    frame, errors = validate(pd.DataFrame(rows))
+    invalid = {int(i): message for i, message in errors.items() if message}
+    if invalid:
+        details = "; ".join(f"row {i}: {message}" for i, message in invalid.items())
+        raise BatchValidationError(details)
+    return frame[FEATURES], single
+
+
+class PredictionServer(ThreadingHTTPServer):
+    # The socketserver default backlog of 5 resets bursts of concurrent clients
+    request_queue_size = 128
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    batcher = None
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            data = metrics.registry.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if self.path != "/health":
+            self._send_json(404, {"error": "Not found"})
+            return
+        _, meta = load_model()
+        self._send_json(
+            200,
+            {
+                "status": "ok",
+                "model_version": meta["version"],
+                "batches": self.batcher.batches,
+                "rows": self.batcher.rows,
+                "cache": prediction_cache.stats(),
+            },
+        )
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": "Not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self._send_json(413, {"error": "Request body too large"})
+            return
+
+        try:
+            frame, single = parse_rows(json.loads(self.rfile.read(length) or b"null"))
+        except json.JSONDecodeError as e:
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+            return
+        except BatchValidationError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        try:
+            # Cached rows answer immediately; only misses join a micro-batch
+            _, meta = load_model()
+            normalized = normalize(frame)
+            keys, prices, missing = prediction_cache.lookup(normalized, meta["version"])
+            if missing:
+                predicted, meta = self.batcher.predict(normalized.iloc[missing])
+                prices[missing] = predicted
+                prediction_cache.store(meta["version"], keys, missing, predicted)
+        except Exception as e:
+            self._send_json(500, {"error": f"Prediction failed: {e}"})
+            return
+
+        results = [
+            {"price": round(float(price), 2), "formatted": format_indian_number(price)}
+            for price in prices
+        ]
+        body = {"model_version": meta["version"]}
+        if single:
+            body.update(results[0])
+        else:
+            body["predictions"] = results
+        self._send_json(200, body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host, port, max_batch_size, max_wait):
+    load_model()
+    batcher = MicroBatcher(max_batch_size, max_wait)
+    handler = type("Handler", (PredictionHandler,), {"batcher": batcher})
+    server = PredictionServer((host, port), handler)
+    print(f"Serving predictions on http://{host}:{port}/predict")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PriceMyRide prediction API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=DEFAULT_MAX_WAIT_MS,
+        help="how long to wait for more requests before predicting",
+    )
+    args = parser.parse_args()
+    serve(args.host, args.port, args.max_batch_size, args.max_wait_ms / 1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import streamlit as st
+
+import auth
+import metrics
+import session
+from firebase_setup import initialize_firebase
+
+
+def logout():
+    session.end_session()
+
+
+def main():
+    # Initialize session; a reload keeps the user logged in through the
+    # signed session cookie
+    if "logged_in" not in st.session_state:
+        st.session_state["logged_in"] = session.restore_session()
+
+    session.sync_cookie()
+    auth.inject_style()
+    if st.session_state["logged_in"]:
+        # Imported on the first logged-in run, so the login page renders
+        # without the app pages (and what they import) loaded
+        import website
+
+        initialize_firebase()
+        website.render()
+        if st.sidebar.button("Logout"):
+            logout()
+            st.success("Logged out successfully.")
+            st.rerun()
+    else:
+        auth.login_page()
+
+
+# Streamlit runs this script as __main__. Job worker processes (jobs.py)
+# are spawned and re-import it as __mp_main__, and must not render anything.
+if __name__ == "__main__":
+    # Module imports and Firebase setup happen once per process; a rerun
+    # only executes the routing below and the page being rendered.
+    with metrics.timer("rerun_seconds"):
+        main()
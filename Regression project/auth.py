@@ -1,38 +1,15 @@
 import streamlit as st
-import requests
 from datetime import datetime
-import os
-from dotenv import load_dotenv
-import importlib.util
-import firebase_admin
-from firebase_admin import credentials, db
-
-# Load env
-load_dotenv()
-FIREBASE_API_KEY = os.getenv("apiKey")
-DATABASE_URL = os.getenv("database_url")
-
-# Firebase REST endpoints
-SIGNUP_URL = (
-    f"https://identitytoolkit.googleapis.com/v1/accounts:signUp?key={FIREBASE_API_KEY}"
-)
-LOGIN_URL = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={FIREBASE_API_KEY}"
-LOOKUP_URL = (
-    f"https://identitytoolkit.googleapis.com/v1/accounts:lookup?key={FIREBASE_API_KEY}"
-)
-SEND_OOB_URL = f"https://identitytoolkit.googleapis.com/v1/accounts:sendOobCode?key={FIREBASE_API_KEY}"
-
-# Initialize Firebase Admin for Realtime Database
-cred = credentials.Certificate("json_key.json")
-if not firebase_admin._apps:
-    firebase_admin.initialize_app(cred, {"databaseURL": DATABASE_URL})
+from identity import IdentityError, client, token_claims
+import metrics
+import replica
+import session
 
 # UI variables
 website_name = "PriceMyRide"
 icon_url = "https://t3.ftcdn.net/jpg/01/71/13/24/360_F_171132449_uK0OO5XHrjjaqx5JUbJOIoCC3GZP84Mt.jpg"
 
-st.markdown(
-    """
+LOGIN_STYLE = """
 <style>
 .title-icon-container { display: flex; align-items: center; padding: 10px 0; }
 .title-icon-container .icon { width: 50px; margin-right: 10px; }
@@ -40,22 +17,25 @@ st.markdown(
 .stButton>button { background-color: #4CAF50; color: white; padding: 10px 20px; border-radius: 12px; }
 .stButton>button:hover { background-color: #32CD32; }
 </style>
-""",
-    unsafe_allow_html=True,
-)
+"""
+
+
+def inject_style():
+    st.markdown(LOGIN_STYLE, unsafe_allow_html=True)
 
 
 # Helper functions
 def send_verification_email(id_token):
     payload = {"requestType": "VERIFY_EMAIL", "idToken": id_token}
-    requests.post(SEND_OOB_URL, json=payload)
+    return client.post_in_background("sendOobCode", payload)
 
 
 def send_password_reset_email(email):
     payload = {"requestType": "PASSWORD_RESET", "email": email}
-    requests.post(SEND_OOB_URL, json=payload)
+    return client.post_in_background("sendOobCode", payload)
 
 
+@metrics.timed("signup_seconds")
 def signup_user(email, password, display_name):
     payload = {
         "email": email,
@@ -63,41 +43,63 @@ def signup_user(email, password, display_name):
         "displayName": display_name,
         "returnSecureToken": True,
     }
-    resp = requests.post(SIGNUP_URL, json=payload).json()
+    try:
+        resp = client.post("signUp", payload, idempotent=False)
+    except IdentityError as e:
+        return {"error": str(e)}
     if "error" in resp:
         return {"error": resp["error"]["message"]}
 
-    # Send email verification
+    # Send email verification (in the background)
     send_verification_email(resp["idToken"])
 
-    # Save profile to Realtime Database
+    # Save profile to Realtime Database through the shared write-behind
+    # queue, which does not start the replica's listeners (and download the
+    # whole feed) for someone who has not logged in yet
     user_id = resp["localId"]
-    db.reference("users").child(user_id).set(
+    replica.get_writer().put(
+        f"users/{user_id}",
         {
             "handle": display_name,
             "email": email,
             "created_at": datetime.now().isoformat(),
-        }
+        },
     )
     return {"success": True}
 
 
+@metrics.timed("login_seconds")
 def authenticate_user(email, password):
     payload = {"email": email, "password": password, "returnSecureToken": True}
-    resp = requests.post(LOGIN_URL, json=payload).json()
-    if "error" in resp:
-        return {"error": resp["error"]["message"]}
+    try:
+        resp = client.post("signInWithPassword", payload)
+        if "error" in resp:
+            return {"error": resp["error"]["message"]}
+
+        # The ID token already carries email_verified, which saves the
+        # accounts:lookup round trip; fall back to it if the claim is missing
+        claims = token_claims(resp["idToken"])
+        if "email_verified" in claims:
+            user_info = {
+                "emailVerified": claims["email_verified"],
+                "displayName": resp.get("displayName") or claims.get("name"),
+            }
+        else:
+            lookup_resp = client.post("lookup", {"idToken": resp["idToken"]})
+            user_info = lookup_resp["users"][0]
+    except IdentityError as e:
+        return {"error": str(e)}
 
-    # Check email verification
-    lookup_resp = requests.post(LOOKUP_URL, json={"idToken": resp["idToken"]}).json()
-    user_info = lookup_resp["users"][0]
     if not user_info["emailVerified"]:
         return {"error": "Email not verified. Please check your inbox."}
 
     return {
         "success": True,
-        "handle": user_info.get("displayName", "User"),
+        "handle": user_info.get("displayName") or "User",
+        "uid": resp["localId"],
         "idToken": resp["idToken"],
+        "refreshToken": resp["refreshToken"],
+        "expiresIn": resp["expiresIn"],
     }
 
 
@@ -155,8 +157,7 @@ def login_page():
             if "error" in resp:
                 st.error(resp["error"])
             else:
-                st.session_state["logged_in"] = True
-                st.session_state["handle"] = resp["handle"]
+                session.start_session(resp)
                 st.success(f"Welcome {resp['handle']}!")
                 st.rerun()
 
@@ -169,26 +170,3 @@ def login_page():
 
     st.write("---")
     st.write("*© 2024 PriceMyRide. All rights reserved.*")
-
-
-# Main website loader
-def main_website():
-    main_website_path = "website.py"
-    spec = importlib.util.spec_from_file_location("main_website", main_website_path)
-    main_website_module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(main_website_module)
-
-
-# Initialize session
-if "logged_in" not in st.session_state:
-    st.session_state["logged_in"] = False
-
-if st.session_state["logged_in"]:
-    main_website()
-    if st.sidebar.button("Logout"):
-        st.session_state["logged_in"] = False
-        st.session_state.pop("handle", None)
-        st.success("Logged out successfully.")
-        st.rerun()
-else:
-    login_page()
@@ -0,0 +1,122 @@
+import argparse
+import sys
+from datetime import datetime
+
+import pandas as pd
+
+from formatting import format_indian_number
+from model import CATEGORICAL_FEATURES, FEATURES, load_model
+
+DEFAULT_CHUNKSIZE = 10000
+MIN_YEAR = 1980
+PRICE_COLUMN = "predicted_price"
+FORMATTED_COLUMN = "predicted_price_formatted"
+ERROR_COLUMN = "error"
+
+
+class BatchValidationError(ValueError):
+    pass
+
+
+def validate(chunk):
+    # Returns the cleaned chunk and a per-row error message ("" when valid)
+    missing = [col for col in FEATURES if col not in chunk.columns]
+    if missing:
+        raise BatchValidationError(f"Missing required columns: {', '.join(missing)}")
+
+    cleaned = chunk[FEATURES].copy()
+    errors = pd.Series("", index=chunk.index)
+
+    for col in CATEGORICAL_FEATURES:
+        values = cleaned[col].astype("string").str.strip()
+        blank = values.isna() | (values == "")
+        errors[blank & (errors == "")] = f"{col} is empty"
+        cleaned[col] = values.fillna("")
+
+    max_year = datetime.now().year
+    year = pd.to_numeric(cleaned["year_built"], errors="coerce")
+    bad_year = year.isna() | (year % 1 != 0) | (year < MIN_YEAR) | (year > max_year)
+    errors[bad_year & (errors == "")] = (
+        f"year_built must be a whole year between {MIN_YEAR} and {max_year}"
+    )
+
+    km = pd.to_numeric(cleaned["km_driven"], errors="coerce")
+    bad_km = km.isna() | (km < 0)
+    errors[bad_km & (errors == "")] = "km_driven must be a non-negative number"
+
+    cleaned["year_built"] = year.fillna(0).astype("int64")
+    cleaned["km_driven"] = km.fillna(0).astype("int64")
+    return cleaned, errors
+
+
+def price_chunk(chunk, pipe, version=None, cache=None):
+    cleaned, errors = validate(chunk)
+    valid = errors == ""
+
+    prices = pd.Series(float("nan"), index=chunk.index)
+    if valid.any():
+        if cache is None:
+            prices[valid] = pipe.predict(cleaned[valid])
+        else:
+            prices[valid] = cache.predict(cleaned[valid], pipe, version)
+
+    # Rejected rows are echoed back exactly as they were submitted
+    result = chunk[FEATURES].copy()
+    result[PRICE_COLUMN] = prices.round(2)
+    result[FORMATTED_COLUMN] = [
+        format_indian_number(price) if ok else "" for price, ok in zip(prices, valid)
+    ]
+    result[ERROR_COLUMN] = errors
+    return result
+
+
+def iter_priced_chunks(source, chunksize=DEFAULT_CHUNKSIZE, cache=None):
+    # Reads the CSV lazily so files larger than memory are priced chunk by
+    # chunk; each chunk is one vectorized predict call. A PredictionCache
+    # can be passed in when the process is long-lived (the app, the API).
+    pipe, meta = load_model()
+    reader = pd.read_csv(source, chunksize=chunksize, dtype=str, skipinitialspace=True)
+    for chunk in reader:
+        yield price_chunk(chunk, pipe, meta["version"], cache)
+
+
+def price_csv(
+    source, destination, chunksize=DEFAULT_CHUNKSIZE, on_progress=None, cache=None
+):
+    rows = 0
+    failed = 0
+    for index, priced in enumerate(iter_priced_chunks(source, chunksize, cache)):
+        priced.to_csv(destination, header=index == 0, index=False)
+        rows += len(priced)
+        failed += int((priced[ERROR_COLUMN] != "").sum())
+        if on_progress:
+            on_progress(rows)
+    return {"rows": rows, "failed": failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Price a CSV of car listings with the trained model"
+    )
+    parser.add_argument("input", help="CSV with columns: " + ", ".join(FEATURES))
+    parser.add_argument("-o", "--output", default="-", help="output CSV (default stdout)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+
+    try:
+        if args.output == "-":
+            summary = price_csv(args.input, sys.stdout, args.chunksize)
+        else:
+            with open(args.output, "w", newline="") as f:
+                summary = price_csv(args.input, f, args.chunksize)
+    except BatchValidationError as e:
+        parser.exit(2, f"error: {e}\n")
+
+    print(
+        f"Priced {summary['rows']} rows ({summary['failed']} rejected)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
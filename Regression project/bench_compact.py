@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import pickle
+import time
+
+from sklearn.metrics import r2_score
+from sklearn.model_selection import train_test_split
+
+from compact_model import CompactForest, compact_paths, export
+from model import artifact_paths, ensure_model, load_training_data, resolve_params
+
+# Compares the published scikit-learn pipeline with the compact export:
+# artifact size, load time, single-row predict latency and holdout R².
+#
+#   python bench_compact.py --out compact.json
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def latency(predict, X, runs):
+    samples = []
+    for i in range(runs):
+        row = X.iloc[[i % len(X)]]
+        start = time.perf_counter()
+        predict(row)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "runs": runs,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p99_ms": samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000,
+    }
+
+
+def load_pickle(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def measure(runs):
+    split = resolve_params()
+    X, y = load_training_data()
+    _, X_test, _, y_test = train_test_split(
+        X, y, test_size=split["test_size"], random_state=split["random_state"]
+    )
+    models = {
+        "pipeline": (artifact_paths(ensure_model()["version"])[0], load_pickle),
+        "compact": (compact_paths(export()["version"])[0], CompactForest.load),
+    }
+
+    results = {}
+    for name, (path, loader) in models.items():
+        model, load_seconds = timed(loader, path)
+        _, batch_seconds = timed(model.predict, X_test)
+        results[name] = {
+            "size_bytes": os.path.getsize(path),
+            "load_ms": load_seconds * 1000,
+            "r2_score": float(r2_score(y_test, model.predict(X_test))),
+            "single_row": latency(model.predict, X_test, runs),
+            "batch_rows_per_s": len(X_test) / batch_seconds,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compact price model")
+    parser.add_argument("--runs", type=int, default=500)
+    parser.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
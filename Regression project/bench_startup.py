@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from streamlit.testing.v1 import AppTest
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGES = [
+    "Home",
+    "Predictions",
+    "Explore Models",
+    "Batch Pricing",
+    "Community",
+    "About",
+]
+# Modules the login page should render without (Streamlit itself imports
+# the plotly package, but not plotly.express)
+HEAVY_MODULES = (
+    "pandas",
+    "numpy",
+    "scipy",
+    "sklearn",
+    "plotly.express",
+    "PIL",
+    "firebase_admin",
+)
+PHASE_MARK = "@@phase"
+
+# Measures time-to-first-render and per-rerun latency of the Streamlit app
+# headlessly. Run it against app.py, and against auth.py on an older checkout
+# to get the "before" numbers:
+#
+#   python bench_startup.py
+#   python bench_startup.py --script auth.py --out before.json
+#
+# --imports instead profiles what each page imports: every page is opened
+# cold in its own `python -X importtime` process (login, then Home, then the
+# page), with background warm-up off, and the import log is split per step.
+#
+#   python bench_startup.py --imports
+
+
+def timed_run(at):
+    start = time.perf_counter()
+    at.run()
+    return time.perf_counter() - start
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "mean_ms": statistics.mean(samples) * 1000,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+def measure(script, reruns):
+    os.chdir(BASE_DIR)
+    at = AppTest.from_file(script, default_timeout=120)
+
+    results = {"script": script, "first_render_ms": timed_run(at) * 1000}
+    results["login_rerun"] = summarize([timed_run(at) for _ in range(reruns)])
+
+    at.session_state["logged_in"] = True
+    at.session_state["handle"] = "bench"
+    results["first_logged_in_ms"] = timed_run(at) * 1000
+
+    results["pages"] = {}
+    for page in PAGES:
+        at.sidebar.selectbox[0].select(page)
+        results["pages"][page] = summarize([timed_run(at) for _ in range(reruns)])
+    return results
+
+
+def _mark(phase):
+    print(f"{PHASE_MARK} {phase} {time.perf_counter()}", file=sys.stderr, flush=True)
+
+
+def _profile_child(script, page):
+    os.chdir(BASE_DIR)
+    at = AppTest.from_file(script, default_timeout=120)
+    _mark("login")
+    at.run()
+    at.session_state["logged_in"] = True
+    at.session_state["handle"] = "bench"
+    _mark("Home")
+    at.run()
+    if page != "Home":
+        _mark(page)
+        at.sidebar.selectbox[0].select(page)
+        at.run()
+    _mark("end")
+
+
+def parse_importtime(log):
+    # Splits a -X importtime log at the phase marks into
+    # {phase: [(module, self_us, cumulative_us, depth)]} and wall times
+    imports, wall, phase, started = {}, {}, None, None
+    for line in log.splitlines():
+        if line.startswith(PHASE_MARK):
+            name, stamp = line[len(PHASE_MARK) :].strip().rsplit(" ", 1)
+            if phase is not None:
+                wall[phase] = float(stamp) - started
+            phase, started = name, float(stamp)
+            imports[phase] = []
+        elif phase is not None and line.startswith("import time:"):
+            self_us, cumulative_us, module = line[len("import time:") :].split("|")
+            if not self_us.strip().isdigit():
+                continue
+            depth = (len(module) - len(module.lstrip()) - 1) // 2
+            imports[phase].append(
+                (module.strip(), int(self_us), int(cumulative_us), depth)
+            )
+    return imports, wall
+
+
+def summarize_imports(imports, wall_s, top=5):
+    modules = {entry[0] for entry in imports}
+    roots = [entry for entry in imports if entry[3] == 0]
+    largest = sorted(roots, key=lambda entry: entry[2], reverse=True)[:top]
+    return {
+        "wall_ms": wall_s * 1000,
+        "import_ms": sum(entry[1] for entry in imports) / 1000,
+        "modules": len(imports),
+        "heavy": [name for name in HEAVY_MODULES if name in modules],
+        "largest": {entry[0]: entry[2] / 1000 for entry in largest},
+    }
+
+
+def profile_imports(script, pages=PAGES):
+    env = {**os.environ, "warmup": "off"}
+    results = {"script": script}
+    for page in pages:
+        proc = subprocess.run(
+            [
+                sys.executable,
+                "-X",
+                "importtime",
+                __file__,
+                "--script",
+                script,
+                "--profile-child",
+                page,
+            ],
+            capture_output=True,
+            text=True,
+            env=env,
+            cwd=BASE_DIR,
+        )
+        imports, wall = parse_importtime(proc.stderr)
+        if page not in wall:
+            raise RuntimeError(f"profiling {page} failed:\n{proc.stderr[-2000:]}")
+        if "login" not in results:
+            results["login"] = summarize_imports(imports["login"], wall["login"])
+        results[page] = summarize_imports(imports[page], wall[page])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app startup and reruns")
+    parser.add_argument("--script", default="app.py")
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument(
+        "--imports", action="store_true", help="profile the import cost of each page"
+    )
+    parser.add_argument("--profile-child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile_child:
+        _profile_child(args.script, args.profile_child)
+        return
+    if args.imports:
+        results = profile_imports(args.script)
+    else:
+        results = measure(args.script, args.reruns)
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
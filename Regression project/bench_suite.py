@@ -0,0 +1,288 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BATCH_SIZES = [1, 10, 100, 1000]
+# A case whose p50 grows by more than this factor over the baseline is
+# reported as a regression
+DEFAULT_TOLERANCE = 1.25
+
+# Latency and throughput of the pricing hot paths. Each case runs in its own
+# process so its peak RSS is not inflated by the cases before it.
+#
+#   python bench_suite.py --out bench.json
+#   python bench_suite.py --baseline bench.json
+
+
+def _percentile(samples, q):
+    return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+def summarize(samples, rows):
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        "runs": len(samples),
+        "wall_s": total,
+        "p50_ms": _percentile(samples, 0.50) * 1000,
+        "p95_ms": _percentile(samples, 0.95) * 1000,
+        "p99_ms": _percentile(samples, 0.99) * 1000,
+        "rows_per_s": rows * len(samples) / total if total else None,
+    }
+
+
+def timed_runs(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _prediction_rows(n):
+    # Rows shaped like the Predictions page input, sampled from the data
+    from data import load_cars
+    from model import FEATURES
+
+    car = load_cars()
+    return car[FEATURES].sample(n, replace=True, random_state=0).reset_index(drop=True)
+
+
+def case_csv_load(runs):
+    from data import DATA_PATH, read_cars
+
+    rows = len(read_cars(DATA_PATH))
+    return summarize(timed_runs(lambda: read_cars(DATA_PATH), runs), rows)
+
+
+def case_cached_load(runs):
+    import column_cache
+    from data import DATA_PATH, SCHEMA, read_cars
+
+    def load():
+        return column_cache.load(DATA_PATH, reader=read_cars, schema=SCHEMA)
+
+    rows = len(load())
+    return summarize(timed_runs(load, runs), rows)
+
+
+def case_fit(runs):
+    from model import build_pipeline, load_training_data
+
+    X, y = load_training_data()
+    return summarize(timed_runs(lambda: build_pipeline().fit(X, y), runs), len(X))
+
+
+def case_single_predict(runs):
+    import pandas as pd
+
+    from model import FEATURES, load_model
+
+    pipe, _ = load_model()
+    rows = _prediction_rows(runs)
+    frames = [pd.DataFrame([row], columns=FEATURES) for row in rows.to_numpy()]
+    samples = []
+    for frame in frames:
+        start = time.perf_counter()
+        pipe.predict(frame)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, 1)
+
+
+def case_batch_predict(runs):
+    from model import load_model
+
+    pipe, _ = load_model()
+    results = {}
+    for size in BATCH_SIZES:
+        batch = _prediction_rows(size)
+        samples = timed_runs(lambda: pipe.predict(batch), runs)
+        results[str(size)] = summarize(samples, size)
+    return results
+
+
+def case_range_predict(runs):
+    # Same batches as batch_predict, with the per-tree quantiles added
+    from model import load_model
+    from price_range import predict_ranges
+
+    pipe, meta = load_model()
+    results = {}
+    for size in BATCH_SIZES:
+        batch = _prediction_rows(size)
+        samples = timed_runs(lambda: predict_ranges(batch, pipe, meta["version"]), runs)
+        results[str(size)] = summarize(samples, size)
+    return results
+
+
+def _surface_rows(n, on_grid):
+    # Sampled Predictions-page queries, moved onto the surface's grid (year
+    # and mileage snapped to grid points) or just off it (mileage + 1 km)
+    import numpy as np
+
+    from price_surface import KM_POINTS, YEARS
+
+    rows = _prediction_rows(n)
+    rows["year_built"] = rows["year_built"].clip(YEARS[0], YEARS[-1])
+    grid = np.array(KM_POINTS)
+    nearest = np.abs(rows["km_driven"].to_numpy()[:, None] - grid).argmin(axis=1)
+    rows["km_driven"] = grid[nearest] + (0 if on_grid else 1)
+    return list(rows.itertuples(index=False, name=None))
+
+
+def _surface_case(runs, on_grid):
+    from model import load_model
+    from price_surface import export, predict_one
+
+    load_model()
+    export()
+    samples = []
+    for row in _surface_rows(runs, on_grid):
+        start = time.perf_counter()
+        predict_one(row, quantiles=(0.1, 0.9))
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, 1)
+
+
+def case_surface_hit(runs):
+    # Single Predictions-page queries answered from the precomputed surface
+    return _surface_case(runs, on_grid=True)
+
+
+def case_surface_miss(runs):
+    # Off-grid queries, answered by the live model (distinct rows, so the
+    # prediction cache mostly misses too)
+    return _surface_case(runs, on_grid=False)
+
+
+def case_explore_groupby(runs):
+    from data import load_cars
+    from stats_cube import StatsCube
+
+    car = load_cars()
+    models = car[["Brand", "Model"]].drop_duplicates().head(5)
+    pairs = list(models.itertuples(index=False, name=None))
+    cube = StatsCube(car)
+    return {
+        "build": summarize(timed_runs(lambda: StatsCube(car), runs), len(car)),
+        "lookup": summarize(
+            timed_runs(lambda: (cube.comparison(pairs), cube.trend(pairs)), runs),
+            len(pairs),
+        ),
+    }
+
+
+CASES = {
+    "csv_load": (case_csv_load, 20),
+    "cached_load": (case_cached_load, 20),
+    "fit": (case_fit, 3),
+    "single_predict": (case_single_predict, 200),
+    "batch_predict": (case_batch_predict, 20),
+    "range_predict": (case_range_predict, 20),
+    "surface_hit": (case_surface_hit, 200),
+    "surface_miss": (case_surface_miss, 200),
+    "explore_groupby": (case_explore_groupby, 20),
+}
+
+
+def _run_case(name, runs):
+    os.chdir(BASE_DIR)
+    fn, default_runs = CASES[name]
+    result = fn(runs or default_runs)
+    return {"result": result, "peak_rss_mb": _peak_rss_mb()}
+
+
+def run(names, runs=None):
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[name] = pool.submit(_run_case, name, runs).result()
+        print(f"{name}: done", file=sys.stderr, flush=True)
+    return {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "cases": results,
+    }
+
+
+def _p50s(result, prefix=""):
+    # Flattens nested case results into {"case/sub": p50_ms}
+    if "p50_ms" in result:
+        return {prefix: result["p50_ms"]}
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(_p50s(value, f"{prefix}/{key}" if prefix else key))
+    return flat
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    rows = []
+    for name, case in current["cases"].items():
+        if name not in baseline["cases"]:
+            continue
+        before = _p50s(baseline["cases"][name]["result"], name)
+        for key, p50 in _p50s(case["result"], name).items():
+            if key in before:
+                ratio = p50 / before[key] if before[key] else float("inf")
+                rows.append(
+                    {
+                        "case": key,
+                        "baseline_p50_ms": before[key],
+                        "p50_ms": p50,
+                        "ratio": ratio,
+                        "regression": ratio > tolerance,
+                    }
+                )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pricing hot paths")
+    parser.add_argument("--case", action="append", choices=sorted(CASES))
+    parser.add_argument("--runs", type=int, help="override each case's run count")
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    results = run(args.case or list(CASES), args.runs)
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["comparison"] = compare(results, json.load(f), args.tolerance)
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    regressions = [row for row in results.get("comparison", []) if row["regression"]]
+    for row in regressions:
+        print(
+            f"REGRESSION {row['case']}: {row['baseline_p50_ms']:.2f} ms -> "
+            f"{row['p50_ms']:.2f} ms ({row['ratio']:.2f}x)",
+            file=sys.stderr,
+        )
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST = "manifest.json"
+
+# Bump when the on-disk layout changes so old caches are rebuilt
+FORMAT_VERSION = 1
+
+DEFAULT_SOURCES = [
+    os.path.join(BASE_DIR, "Clean_car.csv"),
+    os.path.join(BASE_DIR, "archive.zip"),
+    os.path.join(BASE_DIR, "car_resale_prices.csv.zip"),
+]
+
+
+# Cache location and keys
+def cache_root(source, member=None):
+    root = f"{source}.cache"
+    if member:
+        root = os.path.join(root, member.replace("/", "_"))
+    return root
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_key(source):
+    stat = os.stat(source)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _read_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_manifest(root, manifest):
+    path = os.path.join(root, MANIFEST)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def is_fresh(source, member=None, schema=None):
+    # size/mtime is the fast path; the content hash decides when they differ
+    # (e.g. after a fresh checkout touches every file)
+    root = cache_root(source, member)
+    manifest = _read_manifest(root)
+    if manifest is None:
+        return False
+    if manifest["format"] != FORMAT_VERSION or manifest.get("schema") != schema:
+        return False
+    if not os.path.isdir(os.path.join(root, manifest["data_dir"])):
+        return False
+
+    key = source_key(source)
+    if key == manifest["source"]:
+        return True
+    if file_sha256(source) != manifest["sha256"]:
+        return False
+    manifest["source"] = key
+    _write_manifest(root, manifest)
+    return True
+
+
+# Conversion
+def _read_source(source, member, reader):
+    if member is None:
+        return reader(source)
+    with zipfile.ZipFile(source) as archive:
+        with archive.open(member) as f:
+            return reader(f)
+
+
+def _read_only(frame):
+    # Same guarantee as read() for a frame parsed from the source: every
+    # column sits on an array that cannot be written in place
+    arrays = {}
+    for name, series in frame.items():
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = np.array(series.cat.codes)
+            codes.flags.writeable = False
+            arrays[name] = pd.Categorical.from_codes(codes, dtype=series.dtype)
+        else:
+            values = np.array(series.to_numpy())
+            values.flags.writeable = False
+            arrays[name] = values
+    return pd.DataFrame(arrays, copy=False)
+
+
+def build(source, member=None, reader=pd.read_csv, schema=None):
+    frame = _read_source(source, member, reader)
+    sha = file_sha256(source)
+    root = cache_root(source, member)
+    # A fresh directory per build: files that are already mapped must never
+    # be rewritten in place
+    data_dir = f"{sha[:16]}-{os.getpid()}-{time.time_ns()}"
+    target = os.path.join(root, data_dir)
+    os.makedirs(target, exist_ok=True)
+
+    columns = []
+    for index, name in enumerate(frame.columns):
+        series = frame[name]
+        entry = {"name": name, "file": f"{index}.npy"}
+        if isinstance(series.dtype, pd.CategoricalDtype) or not (
+            pd.api.types.is_numeric_dtype(series.dtype)
+            or pd.api.types.is_bool_dtype(series.dtype)
+        ):
+            categorical = series.astype("category").array
+            entry["categories"] = [str(c) for c in categorical.categories]
+            np.save(os.path.join(target, entry["file"]), categorical.codes)
+        else:
+            np.save(os.path.join(target, entry["file"]), series.to_numpy())
+        columns.append(entry)
+
+    previous = _read_manifest(root)
+    _write_manifest(
+        root,
+        {
+            "format": FORMAT_VERSION,
+            "schema": schema,
+            "member": member,
+            "source": source_key(source),
+            "sha256": sha,
+            "rows": int(len(frame)),
+            "data_dir": data_dir,
+            "columns": columns,
+        },
+    )
+    # Processes still mapping the old files keep them alive until they unmap
+    if previous and previous["data_dir"] != data_dir:
+        shutil.rmtree(os.path.join(root, previous["data_dir"]), ignore_errors=True)
+    return frame
+
+
+def read(source, member=None):
+    # Columns are memory-mapped read-only, so every worker process shares the
+    # same page-cache pages instead of holding its own copy
+    root = cache_root(source, member)
+    manifest = _read_manifest(root)
+    data_dir = os.path.join(root, manifest["data_dir"])
+    arrays = {}
+    for entry in manifest["columns"]:
+        values = np.load(os.path.join(data_dir, entry["file"]), mmap_mode="r")
+        if "categories" in entry:
+            values = pd.Categorical.from_codes(values, categories=entry["categories"])
+        arrays[entry["name"]] = values
+    return pd.DataFrame(arrays, copy=False)
+
+
+def load(source, member=None, reader=pd.read_csv, schema=None):
+    # Prefers the columnar cache, (re)builds it when stale and falls back to
+    # parsing the source if the cache cannot be written. Either way the
+    # columns are read-only.
+    try:
+        if not is_fresh(source, member, schema):
+            build(source, member, reader, schema)
+        return read(source, member)
+    except OSError:
+        return _read_only(_read_source(source, member, reader))
+
+
+def members(source):
+    if not zipfile.is_zipfile(source):
+        return [None]
+    with zipfile.ZipFile(source) as archive:
+        return [name for name in archive.namelist() if name.lower().endswith(".csv")]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert the car datasets into memory-mappable column caches"
+    )
+    parser.add_argument("sources", nargs="*", default=DEFAULT_SOURCES)
+    parser.add_argument("--force", action="store_true", help="rebuild fresh caches")
+    args = parser.parse_args()
+
+    # The training dataset is cached with its typed reader so the app and
+    # this script produce the same cache
+    import data
+
+    readers = {os.path.abspath(data.DATA_PATH): (data.read_cars, data.SCHEMA)}
+
+    for source in args.sources:
+        reader, schema = readers.get(os.path.abspath(source), (pd.read_csv, None))
+        for member in members(source):
+            label = f"{source}:{member}" if member else source
+            if not args.force and is_fresh(source, member, schema):
+                print(f"fresh   {label}")
+                continue
+            frame = build(source, member, reader, schema)
+            print(f"built   {label} ({len(frame)} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import metrics
+
+PAGE_SIZE = 10
+# The newest page changes with every upload; older pages rarely do
+FIRST_PAGE_TTL = 30
+PAGE_TTL = 300
+
+_lock = threading.Lock()
+_pages = {}
+
+
+def _sort_key(item):
+    key, car_info = item
+    return (car_info.get("uploaded_on", ""), key)
+
+
+def fetch_page(ref, before=None, page_size=PAGE_SIZE):
+    # Newest-first page of car_info entries older than the (uploaded_on, key)
+    # `before` cursor, ordered and limited on the server (needs ".indexOn":
+    # "uploaded_on" in the database rules). Returns (items, next_cursor).
+    limit = page_size + 1
+    while True:
+        query = ref.order_by_child("uploaded_on")
+        with metrics.timer("firebase_get_seconds", path=ref.path):
+            if before is None:
+                data = query.limit_to_last(limit).get() or {}
+            else:
+                # end_at is inclusive and takes no key, so entries sharing
+                # the cursor's timestamp come back too; they are filtered
+                # out by key below
+                data = query.end_at(before[0]).limit_to_last(limit).get() or {}
+        items = sorted(data.items(), key=_sort_key, reverse=True)
+        if before is not None:
+            items = [item for item in items if _sort_key(item) < tuple(before)]
+        # Stop once a full page plus one is left, or nothing older exists;
+        # otherwise ties at the cursor used up the limit, so widen it
+        if len(items) > page_size or len(data) < limit:
+            break
+        limit *= 2
+
+    page = items[:page_size]
+    next_cursor = _sort_key(page[-1]) if len(items) > page_size else None
+    return page, next_cursor
+
+
+def get_page(ref, before=None, page_size=PAGE_SIZE):
+    # Process-wide cache of fetched pages shared by every session
+    cache_key = (ref.path, before, page_size)
+    now = time.monotonic()
+    with _lock:
+        cached = _pages.get(cache_key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    page = fetch_page(ref, before, page_size)
+    ttl = FIRST_PAGE_TTL if before is None else PAGE_TTL
+    with _lock:
+        _pages[cache_key] = (now + ttl, page)
+    return page
+
+
+def invalidate(ref=None):
+    # Called after an upload so the newest page is refetched
+    with _lock:
+        if ref is None:
+            _pages.clear()
+        else:
+            for key in [key for key in _pages if key[0] == ref.path]:
+                del _pages[key]
+
+
+class CommunityFeed:
+    # Per-session feed state: the entries shown so far and the cursor for
+    # the next "Load more". Pages come from the SQLite replica when one is
+    # given (which can also filter by uploader), otherwise from Firebase.
+
+    def __init__(self, ref, page_size=PAGE_SIZE, replica=None, user_handle=None):
+        self.ref = ref
+        self.page_size = page_size
+        self.replica = replica
+        self.user_handle = user_handle
+        self.items = []
+        self.cursor = None
+        self.exhausted = False
+        self.load_more()
+
+    def load_more(self):
+        if self.exhausted:
+            return []
+        before = self.cursor if self.items else None
+        if self.replica is not None:
+            page, self.cursor = self.replica.page(
+                before, self.page_size, self.user_handle
+            )
+        else:
+            page, self.cursor = get_page(self.ref, before, self.page_size)
+        self.items.extend(page)
+        self.exhausted = self.cursor is None
+        return page
@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import r2_score
+from sklearn.model_selection import train_test_split
+
+from data import DATA_PATH, data_fingerprint
+from model import (
+    CATEGORICAL_FEATURES,
+    FEATURES,
+    MODEL_DIR,
+    _write_atomic,
+    load_training_data,
+    model_version,
+    resolve_params,
+)
+
+# An offline export, compared with the published pipeline by
+# bench_compact.py. The app and API keep serving the scikit-learn pipeline:
+# price ranges and the price surface read its individual trees, and the two
+# models do not give the same prices.
+
+# Bounded trees keep the flattened arrays small and the evaluation loop
+# short (one NumPy step per tree level)
+COMPACT_PARAMS = {
+    "n_estimators": 100,
+    "max_depth": 12,
+    "min_samples_leaf": 1,
+    "max_features": 0.5,
+    "random_state": 42,
+    "test_size": 0.2,
+}
+# Categories with few rows are pulled towards the overall mean price
+SMOOTHING = 30
+
+
+def target_encoding(column, y, smoothing=SMOOTHING):
+    # Smoothed mean price per category: one numeric column per feature
+    # instead of one column per Model string
+    stats = y.groupby(column.astype(str), observed=True).agg(["sum", "count"])
+    prior = float(y.mean())
+    encoded = (stats["sum"] + prior * smoothing) / (stats["count"] + smoothing)
+    return dict(zip(encoded.index, encoded.to_numpy(dtype="float64"))), prior
+
+
+def flatten(rf):
+    # Concatenates every tree's node arrays, with child indices offset to
+    # point into the combined arrays
+    parts = {name: [] for name in ("feature", "threshold", "left", "right", "value")}
+    roots, offset, depth = [], 0, 0
+    for estimator in rf.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left == -1
+        roots.append(offset)
+        # Leaves point at themselves, so rows that reach a leaf early stay
+        # put while deeper rows keep descending
+        own = np.arange(offset, offset + tree.node_count)
+        parts["feature"].append(np.where(is_leaf, 0, tree.feature))
+        parts["threshold"].append(np.where(is_leaf, np.inf, tree.threshold))
+        parts["left"].append(np.where(is_leaf, own, tree.children_left + offset))
+        parts["right"].append(np.where(is_leaf, own, tree.children_right + offset))
+        parts["value"].append(tree.value[:, 0, 0])
+        offset += tree.node_count
+        depth = max(depth, tree.max_depth)
+
+    return {
+        "feature": np.concatenate(parts["feature"]).astype(np.int32),
+        "threshold": np.concatenate(parts["threshold"]).astype(np.float64),
+        "left": np.concatenate(parts["left"]).astype(np.int32),
+        "right": np.concatenate(parts["right"]).astype(np.int32),
+        "value": np.concatenate(parts["value"]).astype(np.float64),
+        "roots": np.array(roots, dtype=np.int32),
+        "depth": depth,
+    }
+
+
+def _encode(frame, encodings, priors):
+    X = np.empty((len(frame), len(FEATURES)), dtype=np.float64)
+    for i, col in enumerate(FEATURES):
+        if col in encodings:
+            mapping, prior = encodings[col], priors[col]
+            values = frame[col].astype(str).str.strip()
+            X[:, i] = [mapping.get(value, prior) for value in values]
+        else:
+            X[:, i] = frame[col].to_numpy(dtype=np.float64)
+    # scikit-learn compares features as float32 against the thresholds;
+    # doing the same keeps the split decisions identical
+    return X.astype(np.float32)
+
+
+class CompactForest:
+    # A random forest stored as flat arrays (all trees' nodes concatenated)
+    # and evaluated level by level with NumPy, for every row and tree at once
+
+    def __init__(self, encodings, priors, arrays):
+        self.encodings = encodings
+        self.priors = priors
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.depth = int(arrays["depth"])
+
+    @classmethod
+    def fit(cls, X, y, params=COMPACT_PARAMS):
+        encodings, priors = {}, {}
+        for col in CATEGORICAL_FEATURES:
+            encodings[col], priors[col] = target_encoding(X[col], y)
+        rf = RandomForestRegressor(
+            n_estimators=params["n_estimators"],
+            max_depth=params["max_depth"],
+            min_samples_leaf=params["min_samples_leaf"],
+            max_features=params["max_features"],
+            random_state=params["random_state"],
+            n_jobs=-1,
+        )
+        rf.fit(_encode(X, encodings, priors), y.to_numpy())
+        return cls(encodings, priors, flatten(rf))
+
+    def encode(self, frame):
+        return _encode(frame, self.encodings, self.priors)
+
+    def predict(self, frame):
+        X = self.encode(frame)
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return self.value[node].mean(axis=1)
+
+    @property
+    def node_count(self):
+        return len(self.feature)
+
+    def save(self, path):
+        arrays = {
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "left": self.left,
+            "right": self.right,
+            "value": self.value,
+            "roots": self.roots,
+            "depth": np.array(self.depth),
+        }
+        for col in CATEGORICAL_FEATURES:
+            mapping = self.encodings[col]
+            arrays[f"{col}__categories"] = np.array(list(mapping), dtype=str)
+            arrays[f"{col}__values"] = np.array(list(mapping.values()))
+            arrays[f"{col}__prior"] = np.array(self.priors[col])
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            encodings, priors = {}, {}
+            for col in CATEGORICAL_FEATURES:
+                categories = arrays[f"{col}__categories"].tolist()
+                values = arrays[f"{col}__values"].tolist()
+                encodings[col] = dict(zip(categories, values))
+                priors[col] = float(arrays[f"{col}__prior"])
+            return cls(encodings, priors, {key: arrays[key] for key in arrays.files})
+
+
+def compact_paths(version):
+    return (
+        os.path.join(MODEL_DIR, f"compact_model-{version}.npz"),
+        os.path.join(MODEL_DIR, f"compact_model-{version}.json"),
+    )
+
+
+def export(data_path=DATA_PATH, force=False):
+    # Trains on the same split as model.train so the R² figures compare
+    fingerprint = data_fingerprint(data_path)
+    version = model_version(fingerprint, {"compact": COMPACT_PARAMS})
+    model_path, meta_path = compact_paths(version)
+    if not force and os.path.exists(model_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            return json.load(f)
+
+    split = resolve_params()
+    X, y = load_training_data(data_path)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=split["test_size"], random_state=split["random_state"]
+    )
+    model = CompactForest.fit(X_train, y_train)
+    score = r2_score(y_test, model.predict(X_test))
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    model.save(model_path)
+    meta = {
+        "version": version,
+        "data_fingerprint": fingerprint,
+        "params": COMPACT_PARAMS,
+        "r2_score": float(score),
+        "nodes": model.node_count,
+        "train_rows": int(len(X_train)),
+    }
+    _write_atomic(meta_path, json.dumps(meta, indent=2))
+    return meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the compact price model")
+    parser.add_argument("--force", action="store_true", help="retrain even if cached")
+    args = parser.parse_args()
+    print(json.dumps(export(force=args.force), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import threading
+import time
+
+import pandas as pd
+
+import column_cache
+import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CLEAN_DATA_PATH = os.path.join(BASE_DIR, "Clean_car.csv")
+# car_data points the app and training at another dataset with the same
+# columns, e.g. the combined one written by ingest.py
+DATA_PATH = os.getenv("car_data", CLEAN_DATA_PATH)
+
+CATEGORY_COLUMNS = [
+    "fuel",
+    "seller_type",
+    "transmission",
+    "previous_owners",
+    "Brand",
+    "Model",
+]
+INT_COLUMNS = {
+    "year_built": "int16",
+    "km_driven": "int32",
+    "Price": "int32",
+}
+COLUMNS = list(INT_COLUMNS) + CATEGORY_COLUMNS
+DTYPES = {**INT_COLUMNS, **{col: "category" for col in CATEGORY_COLUMNS}}
+# Tags the column cache so a dtype change rebuilds it
+SCHEMA = ",".join(f"{col}:{DTYPES[col]}" for col in COLUMNS)
+
+_lock = threading.Lock()
+_frames = {}
+_stats = {}
+_fingerprints = {}
+
+
+def data_fingerprint(path=DATA_PATH):
+    # sha256 of the file, recomputed only when its size or mtime changes
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in _fingerprints:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        _fingerprints[key] = digest.hexdigest()
+    return _fingerprints[key]
+
+
+def read_cars(path=DATA_PATH):
+    # usecols drops the saved index ("Unnamed: 0") without parsing it
+    return pd.read_csv(path, usecols=COLUMNS, dtype=DTYPES)[COLUMNS]
+
+
+def load_cars(path=DATA_PATH):
+    # Loaded once per process (and again only if the file changes on disk),
+    # from the memory-mapped column cache when possible. Callers get a
+    # shallow copy so adding, dropping or reassigning columns never leaks
+    # into the shared frame, and the column arrays underneath are read-only
+    # (see column_cache.load), so writing values in place copies the column
+    # (pandas Copy-on-Write) or raises instead of changing the shared data.
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        cached = _frames.get(path)
+        if cached is None or cached[0] != key:
+            start = time.perf_counter()
+            with metrics.timer("dataset_load_seconds"):
+                frame = column_cache.load(path, reader=read_cars, schema=SCHEMA)
+            elapsed = time.perf_counter() - start
+            _frames[path] = (key, frame)
+            _stats[path] = {
+                "path": path,
+                "rows": int(len(frame)),
+                "load_seconds": elapsed,
+                "memory_bytes": int(frame.memory_usage(deep=True).sum()),
+                "loaded_at": time.time(),
+            }
+        return _frames[path][1].copy(deep=False)
+
+
+def load_stats(path=DATA_PATH):
+    return dict(_stats.get(path, {}))
+
+
+def memory_report(path=DATA_PATH):
+    # Compares the typed frame with a plain pd.read_csv of the same file
+    load_cars(path)
+    report = load_stats(path)
+
+    start = time.perf_counter()
+    untyped = pd.read_csv(path)
+    untyped = untyped.loc[:, ~untyped.columns.str.contains("^Unnamed")]
+    report["untyped_load_seconds"] = time.perf_counter() - start
+    report["untyped_memory_bytes"] = int(untyped.memory_usage(deep=True).sum())
+    report["memory_saving"] = 1 - report["memory_bytes"] / report["untyped_memory_bytes"]
+    return report
+
+
+if __name__ == "__main__":
+    report = memory_report()
+    print(f"Rows: {report['rows']}")
+    print(
+        f"Typed:   {report['memory_bytes'] / 1024:.1f} KiB "
+        f"in {report['load_seconds'] * 1000:.1f} ms"
+    )
+    print(
+        f"Untyped: {report['untyped_memory_bytes'] / 1024:.1f} KiB "
+        f"in {report['untyped_load_seconds'] * 1000:.1f} ms"
+    )
+    print(f"Memory saving: {report['memory_saving']:.1%}")
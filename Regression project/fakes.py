@@ -0,0 +1,412 @@
+import base64
+import itertools
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+# In-process stand-ins for the parts of firebase_admin used by the app, so
+# the feed, uploads and sync code can be exercised without a Firebase project.
+
+
+class FakeDatabase:
+    def __init__(self, data=None):
+        self.data = data or {}
+        self.lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+        # The next this-many set()/update() calls raise, to exercise retries
+        self.fail_writes = 0
+        self._push_ids = itertools.count()
+        self._listeners = []
+
+    def reference(self, path="/"):
+        return FakeReference(self, path)
+
+    def _split(self, path):
+        return [part for part in path.strip("/").split("/") if part]
+
+    def _get(self, path):
+        node = self.data
+        for part in self._split(path):
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def _set(self, path, value):
+        parts = self._split(path)
+        node = self.data
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+    def _push_key(self):
+        # Like Firebase push IDs: chronologically sortable strings
+        return f"-{time.time_ns():020d}{next(self._push_ids):06d}"
+
+    def _write(self):
+        self.writes += 1
+        if self.fail_writes:
+            self.fail_writes -= 1
+            raise ConnectionError("fake database unavailable")
+
+    def _notify(self, changes, event_type="put"):
+        # Like the server, a change below a listener arrives as an event at
+        # the relative path; a change above it as a fresh snapshot
+        for registration in list(self._listeners):
+            root = registration.path.rstrip("/")
+            snapshot = False
+            for path, value in changes:
+                if path == root or path.startswith(root + "/"):
+                    relative = path[len(root) :] or "/"
+                    registration.deliver(FakeEvent(event_type, relative, value))
+                elif root.startswith(path.rstrip("/") + "/"):
+                    snapshot = True
+            if snapshot:
+                registration.deliver(FakeEvent("put", "/", _copy(self._get(root))))
+
+
+class FakeReference:
+    def __init__(self, database, path):
+        self._db = database
+        self.path = "/" + "/".join(database._split(path))
+        self.key = self.path.rsplit("/", 1)[-1] or None
+
+    def child(self, path):
+        return FakeReference(self._db, f"{self.path}/{path}")
+
+    def get(self):
+        with self._db.lock:
+            self._db.reads += 1
+            return _copy(self._db._get(self.path))
+
+    def set(self, value):
+        with self._db.lock:
+            self._db._write()
+            self._db._set(self.path, _copy(value))
+            self._db._notify([(self.path, _copy(value))])
+
+    def update(self, value):
+        # Keys may be multi-location paths ("car_info/<key>"), as on the server
+        with self._db.lock:
+            self._db._write()
+            changes = []
+            for key, item in value.items():
+                path = "/" + "/".join(self._db._split(f"{self.path}/{key}"))
+                self._db._set(path, _copy(item))
+                changes.append((path, _copy(item)))
+            self._db._notify(changes)
+
+    def push(self, value=""):
+        with self._db.lock:
+            ref = self.child(self._db._push_key())
+            ref.set(value)
+            return ref
+
+    def delete(self):
+        self.set(None)
+
+    def order_by_child(self, path):
+        return FakeQuery(self, path)
+
+    def listen(self, callback):
+        # Like db.Reference.listen: the callback runs on a background thread,
+        # first with a put of the whole node, then once per change
+        with self._db.lock:
+            registration = FakeListenerRegistration(self._db, self.path, callback)
+            self._db._listeners.append(registration)
+            registration.deliver(FakeEvent("put", "/", _copy(self._db._get(self.path))))
+        return registration
+
+
+class FakeEvent:
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class FakeListenerRegistration:
+    def __init__(self, database, path, callback):
+        self._db = database
+        self.path = path
+        self._callback = callback
+        self._events = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def deliver(self, event):
+        self._events.put(event)
+
+    def _run(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+            self._callback(event)
+
+    def close(self):
+        with self._db.lock:
+            if self in self._db._listeners:
+                self._db._listeners.remove(self)
+        self._events.put(None)
+        self._thread.join()
+
+
+class FakeQuery:
+    def __init__(self, ref, order_by):
+        self._ref = ref
+        self._order_by = order_by
+        self._start = None
+        self._end = None
+        self._limit_first = None
+        self._limit_last = None
+
+    def start_at(self, value):
+        self._start = value
+        return self
+
+    def end_at(self, value):
+        self._end = value
+        return self
+
+    def limit_to_first(self, limit):
+        self._limit_first = limit
+        return self
+
+    def limit_to_last(self, limit):
+        self._limit_last = limit
+        return self
+
+    def get(self):
+        # Same ordering as the server: by child value, then by key
+        items = (self._ref.get() or {}).items()
+        items = sorted(items, key=lambda kv: (kv[1].get(self._order_by, ""), kv[0]))
+        if self._start is not None:
+            items = [kv for kv in items if kv[1].get(self._order_by, "") >= self._start]
+        if self._end is not None:
+            items = [kv for kv in items if kv[1].get(self._order_by, "") <= self._end]
+        if self._limit_first is not None:
+            items = items[: self._limit_first]
+        if self._limit_last is not None:
+            items = items[-self._limit_last :]
+        return OrderedDict(items)
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+class FakeBucket:
+    def __init__(self, name="fake-bucket"):
+        self.name = name
+        self.objects = {}
+        self.bytes_uploaded = 0
+        self.lock = threading.Lock()
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        return FakeBlob(self, name) if name in self.objects else None
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.content_type = None
+        self.cache_control = None
+        self.public = False
+
+    @property
+    def public_url(self):
+        return f"https://storage.googleapis.com/{self.bucket.name}/{self.name}"
+
+    def exists(self):
+        return self.name in self.bucket.objects
+
+    def upload_from_string(self, data, content_type="text/plain"):
+        if isinstance(data, str):
+            data = data.encode()
+        with self.bucket.lock:
+            self.bucket.objects[self.name] = data
+            self.bucket.bytes_uploaded += len(data)
+        self.content_type = content_type
+
+    def upload_from_file(self, file_obj, content_type=None):
+        content_type = content_type or "application/octet-stream"
+        self.upload_from_string(file_obj.read(), content_type)
+
+    def download_as_bytes(self):
+        return self.bucket.objects[self.name]
+
+    def make_public(self):
+        self.public = True
+
+
+def _unsigned_token(claims):
+    def encode(part):
+        raw = json.dumps(part).encode()
+        return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+    return f"{encode({'alg': 'none'})}.{encode(claims)}.signature"
+
+
+class MockIdentityServer:
+    # Local HTTP stand-in for the Identity Toolkit accounts:* endpoints and
+    # the securetoken refresh endpoint. Point the app at it with
+    # identity_toolkit_url and secure_token_url set to <server.base_url>.
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.latency = latency
+        self.accounts = {}
+        self.refresh_tokens = {}
+        self.emails = []
+        self.requests = []
+        self._failures = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fail_next(self, count=1, status=503):
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def verify_email(self, email):
+        self.accounts[email]["emailVerified"] = True
+
+    def _tokens(self, account):
+        refresh_token = uuid.uuid4().hex
+        self.refresh_tokens[refresh_token] = account["email"]
+        id_token = _unsigned_token(
+            {
+                "user_id": account["localId"],
+                "email": account["email"],
+                "email_verified": account["emailVerified"],
+                "name": account["displayName"],
+                "exp": int(time.time()) + 3600,
+            }
+        )
+        return {
+            "idToken": id_token,
+            "refreshToken": refresh_token,
+            "expiresIn": "3600",
+            "localId": account["localId"],
+            "email": account["email"],
+            "displayName": account["displayName"],
+        }
+
+    def _account_for_token(self, id_token):
+        payload = id_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return self.accounts.get(claims["email"])
+
+    def handle(self, endpoint, body):
+        if endpoint == "signUp":
+            if body["email"] in self.accounts:
+                return 400, {"error": {"code": 400, "message": "EMAIL_EXISTS"}}
+            account = {
+                "localId": uuid.uuid4().hex[:28],
+                "email": body["email"],
+                "password": body["password"],
+                "displayName": body.get("displayName", ""),
+                "emailVerified": False,
+            }
+            self.accounts[body["email"]] = account
+            return 200, self._tokens(account)
+        if endpoint == "signInWithPassword":
+            account = self.accounts.get(body["email"])
+            if account is None or account["password"] != body["password"]:
+                error = {"code": 400, "message": "INVALID_LOGIN_CREDENTIALS"}
+                return 400, {"error": error}
+            return 200, {**self._tokens(account), "registered": True}
+        if endpoint == "lookup":
+            account = self._account_for_token(body["idToken"])
+            if account is None:
+                return 400, {"error": {"code": 400, "message": "INVALID_ID_TOKEN"}}
+            user = {key: account[key] for key in ("localId", "email", "displayName")}
+            return 200, {"users": [{**user, "emailVerified": account["emailVerified"]}]}
+        if endpoint == "sendOobCode":
+            self.emails.append(body)
+            if "email" in body:
+                return 200, {"email": body["email"]}
+            return 200, {"email": self._account_for_token(body["idToken"])["email"]}
+        if endpoint == "token":
+            email = self.refresh_tokens.get(body.get("refresh_token"))
+            if email is None:
+                return 400, {"error": {"code": 400, "message": "INVALID_REFRESH_TOKEN"}}
+            tokens = self._tokens(self.accounts[email])
+            return 200, {
+                "id_token": tokens["idToken"],
+                "refresh_token": tokens["refreshToken"],
+                "expires_in": tokens["expiresIn"],
+                "user_id": tokens["localId"],
+                "token_type": "Bearer",
+            }
+        return 404, {"error": {"code": 404, "message": "NOT_FOUND"}}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                path = self.path.split("?")[0]
+                endpoint = path.rsplit(":", 1)[-1]
+                if path.endswith("/token"):
+                    endpoint = "token"
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length)
+                if "json" in (self.headers.get("Content-Type") or ""):
+                    body = json.loads(raw or b"{}")
+                else:
+                    body = dict(parse_qsl(raw.decode()))
+                if server.latency:
+                    time.sleep(server.latency)
+                with server._lock:
+                    server.requests.append(endpoint)
+                    failure = server._failures.pop(0) if server._failures else None
+                    if failure:
+                        status, reply = failure, {"error": {"code": failure}}
+                    else:
+                        status, reply = server.handle(endpoint, body)
+                data = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,27 @@
+import os
+
+from dotenv import load_dotenv
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Load env
+load_dotenv()
+FIREBASE_API_KEY = os.getenv("apiKey")
+DATABASE_URL = os.getenv("database_url")
+STORAGE_BUCKET = os.getenv("storage")
+KEY_FILE = os.path.join(BASE_DIR, "json_key.json")
+
+
+def initialize_firebase():
+    # Safe to call on every rerun: the default app is created once per
+    # process. firebase_admin is imported here so that the login page, which
+    # only needs the settings above, never loads it.
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(KEY_FILE)
+        firebase_admin.initialize_app(
+            cred, {"databaseURL": DATABASE_URL, "storageBucket": STORAGE_BUCKET}
+        )
+    return firebase_admin.get_app()
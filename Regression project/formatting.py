@@ -0,0 +1,9 @@
+def format_indian_number(number):
+    if number >= 10000000:
+        return f"{number / 10000000:.2f} Cr"
+    elif number >= 100000:
+        return f"{number / 100000:.2f} Lakh"
+    elif number >= 1000:
+        return f"{number / 1000:.2f} Thousand"
+    else:
+        return f"{number:.2f}"
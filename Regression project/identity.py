@@ -0,0 +1,147 @@
+import base64
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+import metrics
+from firebase_setup import FIREBASE_API_KEY
+
+# Overridable so the client can be pointed at a local mock server
+IDENTITY_TOOLKIT_URL = os.getenv(
+    "identity_toolkit_url", "https://identitytoolkit.googleapis.com/v1"
+)
+SECURE_TOKEN_URL = os.getenv(
+    "secure_token_url", "https://securetoken.googleapis.com/v1"
+)
+TIMEOUT = (3.05, 10)
+MAX_RETRIES = 3
+BACKOFF = 0.25
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+POOL_SIZE = 20
+
+logger = logging.getLogger(__name__)
+
+
+class IdentityError(Exception):
+    pass
+
+
+def _record(endpoint, start, ok):
+    elapsed = time.perf_counter() - start
+    metrics.observe("identity_request_seconds", elapsed, ok, endpoint=endpoint)
+
+
+def _not_sent(error):
+    # True when the connection could not be opened at all, so the server
+    # cannot have seen the request. Resets and disconnects after the body
+    # went out are ConnectionErrors too, but are not safe to resend.
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class IdentityClient:
+    # One keep-alive session for every Identity Toolkit call in the process,
+    # with timeouts and bounded retries; latency, errors and retries go to
+    # the metrics registry per endpoint
+
+    def __init__(
+        self,
+        api_key=FIREBASE_API_KEY,
+        base_url=IDENTITY_TOOLKIT_URL,
+        token_url=SECURE_TOKEN_URL,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.token_url = token_url.rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._background = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="identity"
+        )
+
+    def post(self, endpoint, payload, idempotent=True):
+        url = f"{self.base_url}/accounts:{endpoint}"
+        return self._request(endpoint, url, idempotent, json=payload)
+
+    def refresh(self, refresh_token):
+        # Exchanges a refresh token for a new ID token (securetoken API)
+        data = {"grant_type": "refresh_token", "refresh_token": refresh_token}
+        return self._request("token", f"{self.token_url}/token", True, data=data)
+
+    def _request(self, endpoint, url, idempotent, **body):
+        # Idempotent calls are retried on connection failures, timeouts and
+        # 5xx/429. Other calls (a retried signUp could run twice) are retried
+        # only when the request never reached the server.
+        for attempt in range(MAX_RETRIES + 1):
+            start = time.perf_counter()
+            try:
+                resp = self.session.post(
+                    url, params={"key": self.api_key}, timeout=TIMEOUT, **body
+                )
+            except requests.RequestException as e:
+                _record(endpoint, start, False)
+                if idempotent:
+                    retryable = isinstance(
+                        e, (requests.ConnectionError, requests.Timeout)
+                    )
+                else:
+                    retryable = _not_sent(e)
+                if not retryable or attempt == MAX_RETRIES:
+                    raise IdentityError(f"{endpoint} request failed: {e}") from e
+            else:
+                retry = idempotent and resp.status_code in RETRY_STATUSES
+                _record(endpoint, start, not retry)
+                if not retry or attempt == MAX_RETRIES:
+                    try:
+                        return resp.json()
+                    except ValueError as e:
+                        raise IdentityError(
+                            f"{endpoint} returned HTTP {resp.status_code}"
+                        ) from e
+
+            metrics.count("identity_retries_total", endpoint=endpoint)
+            time.sleep(BACKOFF * 2**attempt)
+
+    def post_in_background(self, endpoint, payload):
+        # Fire-and-forget calls (emails) return immediately; failures are
+        # logged and counted since no caller is waiting on them
+        future = self._background.submit(self.post, endpoint, payload)
+        future.add_done_callback(lambda future: _log_failure(endpoint, future))
+        return future
+
+
+def _log_failure(endpoint, future):
+    try:
+        resp = future.result()
+    except Exception as e:
+        error = e
+    else:
+        if "error" not in resp:
+            return
+        error = resp["error"].get("message") or resp["error"]
+    metrics.count("identity_background_failures_total", endpoint=endpoint)
+    logger.warning("Background %s call failed: %s", endpoint, error)
+
+
+def token_claims(id_token):
+    # Reads the payload of an ID token we just received from the Identity
+    # Toolkit over TLS; this is not a signature check
+    try:
+        payload = id_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except (IndexError, ValueError):
+        return {}
+
+
+client = IdentityClient()
@@ -0,0 +1,202 @@
+import argparse
+import copy
+import json
+import pickle
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import r2_score
+from sklearn.model_selection import train_test_split
+
+from data import DATA_PATH, data_fingerprint, read_cars
+from model import (
+    CATEGORICAL_FEATURES,
+    FEATURES,
+    TARGET,
+    _write_atomic,
+    artifact_paths,
+    load_training_data,
+    model_version,
+    publish,
+    publish_rows,
+    read_current,
+    read_rows,
+    row_hashes,
+    train,
+)
+
+# Fewer new rows than this are left for the next run
+MIN_NEW_ROWS = 50
+# Share of new rows held out to measure drift before anything is trained
+HOLDOUT_SIZE = 0.2
+# A full refit replaces warm starting when R² on the new holdout falls this
+# far below the score the model was published with...
+DRIFT_THRESHOLD = 0.05
+# ...when this share of new rows carries a brand/model/etc. the encoder has
+# never seen (new trees cannot split on those)...
+UNKNOWN_THRESHOLD = 0.1
+# ...or when warm starting would grow the forest past this many times the
+# trained tree count
+MAX_GROWTH = 3
+# Old rows replayed next to the new ones, so the added trees still learn
+# the whole market and not only the latest listings
+REPLAY_RATIO = 1.0
+
+
+def append_rows(rows, data_path=DATA_PATH):
+    # Appends listings to the dataset by rewriting it atomically, so readers
+    # never see a half-written file
+    current = pd.read_csv(data_path)
+    current = current.loc[:, ~current.columns.str.contains("^Unnamed")]
+    combined = pd.concat([current, rows[current.columns]], ignore_index=True)
+    _write_atomic(data_path, combined.to_csv(index=False))
+    return len(rows)
+
+
+def unknown_rate(pipe, X):
+    encoder = pipe[0].named_transformers_["onehotencoder"]
+    unknown = np.zeros(len(X), dtype=bool)
+    for col, categories in zip(CATEGORICAL_FEATURES, encoder.categories_):
+        unknown |= ~X[col].astype(str).isin(set(categories))
+    return float(unknown.mean()) if len(X) else 0.0
+
+
+def _score(pipe, X, y):
+    return float(r2_score(y, pipe.predict(X))) if len(y) > 1 else None
+
+
+def warm_start(pipe, X_new, y_new, X_replay, y_replay, add_trees):
+    # Adds trees fitted on the new rows (plus replayed old ones) through the
+    # already fitted one-hot encoder; the existing trees are kept as they are
+    pipe = copy.deepcopy(pipe)
+    column_trans, rf = pipe[0], pipe[-1]
+    X = pd.concat([X_new, X_replay])
+    y = pd.concat([y_new, y_replay])
+    rf.set_params(warm_start=True, n_estimators=len(rf.estimators_) + add_trees)
+    rf.fit(column_trans.transform(X), y)
+    rf.set_params(warm_start=False)
+    return pipe
+
+
+def update(
+    data_path=DATA_PATH,
+    drift_threshold=DRIFT_THRESHOLD,
+    min_new_rows=MIN_NEW_ROWS,
+    force=False,
+):
+    # Brings the published model up to date with the dataset and returns a
+    # report of what was done ("current", "waiting", "warm_start", "retrain")
+    current = read_current()
+    fingerprint = data_fingerprint(data_path)
+    X, y = load_training_data(data_path)
+    hashes = row_hashes(X, y)
+
+    seen = read_rows(current["version"]) if current else None
+    if seen is None:
+        if current and current["data_fingerprint"] == fingerprint:
+            # Published before rows were tracked, but on exactly this data
+            publish_rows(current["version"], hashes)
+            return {"action": "current", "meta": current}
+        meta = train(data_path=data_path, force=True)
+        return {"action": "retrain", "reason": "no tracked rows", "meta": meta}
+
+    new = ~np.isin(hashes, seen)
+    new_rows = int(new.sum())
+    if new_rows == 0:
+        return {"action": "current", "meta": current}
+    if new_rows < min_new_rows and not force:
+        return {"action": "waiting", "new_rows": new_rows, "meta": current}
+
+    with open(artifact_paths(current["version"])[0], "rb") as f:
+        pipe = pickle.load(f)
+    params = current["params"]
+    X_new, y_new = X[new], y[new]
+    X_fit, X_holdout, y_fit, y_holdout = train_test_split(
+        X_new, y_new, test_size=HOLDOUT_SIZE, random_state=params["random_state"]
+    )
+
+    base_trees = params["n_estimators"]
+    trees = len(pipe[-1].estimators_)
+    add_trees = max(10, round(base_trees * new_rows / len(seen)))
+    drift = {
+        "new_rows": new_rows,
+        "holdout_r2": _score(pipe, X_holdout, y_holdout),
+        "published_r2": current["r2_score"],
+        "unknown_rate": unknown_rate(pipe, X_new),
+    }
+    reasons = []
+    if (
+        drift["holdout_r2"] is not None
+        and current["r2_score"] - drift["holdout_r2"] > drift_threshold
+    ):
+        reasons.append("accuracy drift")
+    if drift["unknown_rate"] > UNKNOWN_THRESHOLD:
+        reasons.append("unseen categories")
+    if trees + add_trees > base_trees * MAX_GROWTH:
+        reasons.append("forest size")
+
+    if reasons:
+        meta = train(params, data_path, force=True)
+        reason = ", ".join(reasons)
+        return {"action": "retrain", "reason": reason, **drift, "meta": meta}
+
+    old = ~new
+    replay = min(int(old.sum()), round(len(X_fit) * REPLAY_RATIO))
+    replay_idx = np.random.default_rng(params["random_state"]).choice(
+        np.flatnonzero(old), size=replay, replace=False
+    )
+    pipe = warm_start(
+        pipe, X_fit, y_fit, X.iloc[replay_idx], y.iloc[replay_idx], add_trees
+    )
+
+    meta = {
+        # Versions of warm-started models chain on the model they extend
+        "version": model_version(
+            fingerprint, {**params, "warm_start_from": current["version"]}
+        ),
+        "data_fingerprint": fingerprint,
+        "params": params,
+        # Drift is always measured against the score of the last full fit
+        "r2_score": current["r2_score"],
+        "train_rows": current["train_rows"] + len(X_fit),
+        "trained_at": datetime.now().isoformat(),
+        "incremental": {
+            "base_version": current["version"],
+            "trees": trees + add_trees,
+            "added_trees": add_trees,
+            "added_rows": len(X_fit),
+            "replayed_rows": replay,
+            "holdout_r2_before": drift["holdout_r2"],
+            "holdout_r2_after": _score(pipe, X_holdout, y_holdout),
+        },
+    }
+    publish(pipe, meta, rows=np.concatenate([seen, hashes[new]]))
+    return {"action": "warm_start", **drift, "meta": meta}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Update the published price model with newly added listings"
+    )
+    parser.add_argument("--append", help="CSV of new listings to add to the dataset")
+    parser.add_argument("--drift-threshold", type=float, default=DRIFT_THRESHOLD)
+    parser.add_argument("--min-new-rows", type=int, default=MIN_NEW_ROWS)
+    parser.add_argument(
+        "--force", action="store_true", help="update even with few new rows"
+    )
+    args = parser.parse_args()
+
+    if args.append:
+        rows = read_cars(args.append)[FEATURES + [TARGET]]
+        print(f"Appended {append_rows(rows)} rows to {DATA_PATH}")
+    report = update(
+        drift_threshold=args.drift_threshold,
+        min_new_rows=args.min_new_rows,
+        force=args.force,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import argparse
+import json
+import os
+import zipfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data import BASE_DIR, CATEGORY_COLUMNS, CLEAN_DATA_PATH, COLUMNS, load_cars
+
+CHUNK_SIZE = 5000
+MIN_YEAR = 1980
+COMBINED_PATH = os.path.join(BASE_DIR, "combined_cars.csv")
+
+# Values outside these sets are dropped, as they were when Clean_car.csv was
+# cleaned by hand from CAR DETAILS FROM CAR DEKHO.csv
+FUELS = {"Petrol", "Diesel", "CNG"}
+TRANSMISSIONS = {"Manual", "Automatic"}
+OWNERS = {
+    "first owner": "Zero",
+    "first": "Zero",
+    "second owner": "One",
+    "second": "One",
+    "third owner": "Two",
+    "third": "Two",
+}
+SELLERS = {
+    "individual": "Individual",
+    "dealer": "Dealer",
+    "trustmark dealer": "Dealer",
+    "corporate": "Dealer",
+    "commercial registration": "Dealer",
+}
+PRICE_UNITS = {"lakh": 100_000, "crore": 10_000_000}
+
+
+# Normalizers: each maps one raw chunk to the Clean_car.csv columns
+def _split_name(names):
+    # Clean_car.csv takes the first word of the listing name as Brand and the
+    # first three words as Model ("Maruti Wagon R LXI Minor" -> "Maruti Wagon R")
+    words = names.astype(str).str.strip().str.split()
+    return words.str[0], words.str[:3].str.join(" ")
+
+
+def _lookup(values, mapping):
+    return values.astype(str).str.strip().str.lower().map(mapping)
+
+
+def _to_number(values):
+    return pd.to_numeric(
+        values.astype(str).str.replace(r"[^\d.]", "", regex=True), errors="coerce"
+    )
+
+
+def normalize_dekho(chunk):
+    # CAR DETAILS FROM CAR DEKHO.csv and Car details v3.csv
+    brand, model = _split_name(chunk["name"])
+    return pd.DataFrame(
+        {
+            "year_built": pd.to_numeric(chunk["year"], errors="coerce"),
+            "Price": pd.to_numeric(chunk["selling_price"], errors="coerce"),
+            "km_driven": pd.to_numeric(chunk["km_driven"], errors="coerce"),
+            "fuel": chunk["fuel"],
+            "seller_type": _lookup(chunk["seller_type"], SELLERS),
+            "transmission": chunk["transmission"],
+            "previous_owners": _lookup(chunk["owner"], OWNERS),
+            "Brand": brand,
+            "Model": model,
+        }
+    )
+
+
+def normalize_v4(chunk):
+    # car details v4.csv: make and model are separate ("Maruti Suzuki",
+    # "Swift DZire VDI"), so they are joined back into a listing name
+    make = chunk["Make"].astype(str).str.split().str[0]
+    brand, model = _split_name(make + " " + chunk["Model"].astype(str))
+    return pd.DataFrame(
+        {
+            "year_built": pd.to_numeric(chunk["Year"], errors="coerce"),
+            "Price": pd.to_numeric(chunk["Price"], errors="coerce"),
+            "km_driven": pd.to_numeric(chunk["Kilometer"], errors="coerce"),
+            "fuel": chunk["Fuel Type"],
+            "seller_type": _lookup(chunk["Seller Type"], SELLERS),
+            "transmission": chunk["Transmission"],
+            "previous_owners": _lookup(chunk["Owner"], OWNERS),
+            "Brand": brand,
+            "Model": model,
+        }
+    )
+
+
+def _parse_price(values):
+    # "₹ 5.45 Lakh", "₹ 1.2 Crore" or a plain "₹ 95,000"
+    text = values.astype(str).str.lower()
+    amount = _to_number(text.str.replace(r"(lakh|crore)", "", regex=True))
+    unit = text.str.extract(r"(lakh|crore)", expand=False).map(PRICE_UNITS).fillna(1)
+    return amount * unit
+
+
+def normalize_resale(chunk):
+    # car_resale_prices.csv: "2017 Maruti Baleno 1.2 Alpha" carries the model
+    # year in front of the name; listings come from a dealer marketplace
+    full_name = chunk["full_name"].astype(str).str.strip()
+    year = pd.to_numeric(full_name.str.extract(r"^(\d{4})\s", expand=False))
+    brand, model = _split_name(full_name.str.replace(r"^\d{4}\s+", "", regex=True))
+    return pd.DataFrame(
+        {
+            "year_built": year,
+            "Price": _parse_price(chunk["resale_price"]),
+            "km_driven": _to_number(chunk["kms_driven"]),
+            "fuel": chunk["fuel_type"],
+            "seller_type": "Dealer",
+            "transmission": chunk["transmission_type"],
+            "previous_owners": _lookup(chunk["owner_type"], OWNERS),
+            "Brand": brand,
+            "Model": model,
+        }
+    )
+
+
+def normalize_clean(chunk):
+    return chunk[COLUMNS]
+
+
+# (path, zip member or None, normalizer). Order matters: the first spelling
+# seen for a brand or model is the one kept, so the hand-cleaned file leads.
+# "car data.csv" is left out: it has no make column (names like "ritz") and
+# mixes in two-wheelers.
+ARCHIVE = os.path.join(BASE_DIR, "archive.zip")
+RESALE_ARCHIVE = os.path.join(BASE_DIR, "car_resale_prices.csv.zip")
+SOURCES = [
+    (CLEAN_DATA_PATH, None, normalize_clean),
+    (ARCHIVE, "CAR DETAILS FROM CAR DEKHO.csv", normalize_dekho),
+    (ARCHIVE, "Car details v3.csv", normalize_dekho),
+    (RESALE_ARCHIVE, "car_resale_prices.csv", normalize_resale),
+    (ARCHIVE, "car details v4.csv", normalize_v4),
+]
+
+
+def iter_chunks(path, member=None, chunksize=CHUNK_SIZE):
+    # Streams a CSV, or a CSV inside a zip archive, without extracting it
+    if member is None:
+        with pd.read_csv(path, chunksize=chunksize) as reader:
+            yield from reader
+        return
+    with zipfile.ZipFile(path) as archive, archive.open(member) as f:
+        with pd.read_csv(f, chunksize=chunksize) as reader:
+            yield from reader
+
+
+class Canonicalizer:
+    # Case-insensitive spellings ("Swift DZire" / "Swift Dzire") collapse onto
+    # the first spelling seen
+    def __init__(self):
+        self.spellings = {}
+
+    def __call__(self, values):
+        for value in values.unique():
+            self.spellings.setdefault(value.lower(), value)
+        return values.str.lower().map(self.spellings)
+
+
+def clean(frame, canonical):
+    # Drops rows outside the Clean_car.csv schema and casts the rest
+    for col in ("fuel", "transmission", "Brand", "Model"):
+        frame[col] = frame[col].astype("string").str.strip()
+    max_year = datetime.now().year
+    valid = (
+        frame["fuel"].isin(FUELS)
+        & frame["transmission"].isin(TRANSMISSIONS)
+        & frame["seller_type"].notna()
+        & frame["previous_owners"].notna()
+        & frame["Brand"].notna()
+        & frame["Model"].notna()
+        & frame["year_built"].between(MIN_YEAR, max_year)
+        & (frame["Price"] > 0)
+        & (frame["km_driven"] >= 0)
+    )
+    frame = frame[valid].copy()
+    frame["Brand"] = canonical["Brand"](frame["Brand"])
+    frame["Model"] = canonical["Model"](frame["Model"])
+    for col in ("year_built", "Price", "km_driven"):
+        frame[col] = frame[col].round().astype("int64")
+    return frame[COLUMNS].astype({col: str for col in CATEGORY_COLUMNS})
+
+
+def ingest(destination=COMBINED_PATH, sources=SOURCES, chunksize=CHUNK_SIZE):
+    # Streams every source chunk by chunk into one deduplicated CSV. Only the
+    # 64-bit hashes of rows already written are kept in memory.
+    canonical = {"Brand": Canonicalizer(), "Model": Canonicalizer()}
+    seen = set()
+    report = {"sources": [], "rows": 0}
+    tmp_path = f"{destination}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", newline="") as out:
+        out.write(",".join(COLUMNS) + "\n")
+        for path, member, normalize in sources:
+            stats = {"source": os.path.basename(path), "member": member}
+            stats.update(read=0, kept=0, invalid=0, duplicate=0)
+            for chunk in iter_chunks(path, member, chunksize):
+                stats["read"] += len(chunk)
+                frame = clean(normalize(chunk), canonical)
+                stats["invalid"] += len(chunk) - len(frame)
+
+                hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+                # Duplicates within this chunk as well as against earlier ones
+                _, first = np.unique(hashes, return_index=True)
+                fresh = np.zeros(len(frame), dtype=bool)
+                fresh[first] = True
+                fresh &= np.fromiter((h not in seen for h in hashes), bool, len(hashes))
+                seen.update(hashes[fresh].tolist())
+
+                stats["duplicate"] += int((~fresh).sum())
+                stats["kept"] += int(fresh.sum())
+                frame[fresh].to_csv(out, header=False, index=False)
+            report["sources"].append(stats)
+            report["rows"] += stats["kept"]
+    os.replace(tmp_path, destination)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the combined training dataset from the bundled raw data"
+    )
+    parser.add_argument("--out", default=COMBINED_PATH)
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    report = ingest(args.out, chunksize=args.chunksize)
+    # Builds the typed column cache right away so the first load is fast
+    load_cars(args.out)
+    print(json.dumps(report, indent=2))
+    print(f"Serve and train on it with car_data={args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import metrics
+
+IO_WORKERS = 8
+CPU_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+# Queued plus running jobs allowed per user; system jobs (owner None) are
+# deduplicated by key instead
+MAX_ACTIVE_PER_USER = 2
+# Finished jobs stay fetchable, and reusable by key, for this long
+RESULT_TTL = 600
+MAX_FINISHED = 256
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = (
+    "queued",
+    "running",
+    "done",
+    "failed",
+    "cancelled",
+)
+
+# Set in thread-pool workers to the Job being run, so report() can find it
+_local = threading.local()
+# Set in process-pool workers by the pool initializer
+_worker = {"queue": None, "job_id": None}
+
+
+class JobLimitError(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind, owner, key, label):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.key = key
+        self.label = label
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._started = None
+        self._future = None
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def _report(self, fraction, message):
+        if self._started is None:
+            self._started = time.perf_counter()
+            self.status = RUNNING
+        if fraction is not None:
+            self.progress = min(max(float(fraction), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+
+def report(fraction=None, message=None):
+    # Called from inside a job function to publish progress. In a thread job
+    # it is also the cancellation point: a cancelled job stops here. Outside
+    # a job (e.g. the same function run from the command line) it does nothing.
+    job = getattr(_local, "job", None)
+    if job is not None:
+        if job.cancel_requested:
+            raise JobCancelled(job.id)
+        job._report(fraction, message)
+    elif _worker["queue"] is not None:
+        _worker["queue"].put((_worker["job_id"], fraction, message, None))
+
+
+def _run_in_thread(job, fn, args, kwargs):
+    _local.job = job
+    try:
+        report(0.0)
+        return fn(*args, **kwargs)
+    finally:
+        _local.job = None
+
+
+def _init_process(queue):
+    _worker["queue"] = queue
+
+
+def _run_in_process(job_id, fn, args, kwargs):
+    # Metrics recorded by fn land in this process's registry; they are sent
+    # back over the progress queue and replayed into the app's
+    _worker["job_id"] = job_id
+    metrics.registry.journal()
+    try:
+        report(0.0)
+        return fn(*args, **kwargs)
+    finally:
+        _worker["queue"].put((job_id, None, None, metrics.registry.journal()))
+        _worker["job_id"] = None
+
+
+class JobRunner:
+    # I/O-bound work (Firebase, Storage) runs on a thread pool in this
+    # process; CPU-bound work (model fits) runs on a process pool so it
+    # neither holds the GIL nor ties up Streamlit's script threads. Jobs are
+    # looked up by ID, so sessions keep only the ID in st.session_state.
+
+    def __init__(
+        self,
+        io_workers=IO_WORKERS,
+        cpu_workers=CPU_WORKERS,
+        max_active_per_user=MAX_ACTIVE_PER_USER,
+        result_ttl=RESULT_TTL,
+    ):
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self.max_active_per_user = max_active_per_user
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._by_key = {}
+        self._threads = None
+        self._processes = None
+        self._progress = None
+
+    def _thread_pool(self):
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(
+                max_workers=self.io_workers, thread_name_prefix="job"
+            )
+        return self._threads
+
+    def _process_pool(self):
+        # Started on first use; spawn keeps the workers free of the parent's
+        # threads and open sockets
+        if self._processes is None:
+            context = multiprocessing.get_context("spawn")
+            self._progress = context.Queue()
+            self._processes = ProcessPoolExecutor(
+                max_workers=self.cpu_workers,
+                mp_context=context,
+                initializer=_init_process,
+                initargs=(self._progress,),
+            )
+            threading.Thread(
+                target=self._drain_progress, name="job-progress", daemon=True
+            ).start()
+        return self._processes
+
+    def _drain_progress(self):
+        while True:
+            job_id, fraction, message, journal = self._progress.get()
+            if journal is not None:
+                metrics.registry.replay(journal)
+                continue
+            job = self.get(job_id)
+            if job is not None and not job.finished:
+                job._report(fraction, message)
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl
+        finished = [job for job in self._jobs.values() if job.finished]
+        expired = len(finished) - MAX_FINISHED
+        for job in finished:
+            if job.finished_at < cutoff or expired > 0:
+                expired -= 1
+                del self._jobs[job.id]
+                if self._by_key.get(job.key) == job.id:
+                    del self._by_key[job.key]
+
+    def submit(self, kind, fn, *args, owner=None, key=None, label=None, **kwargs):
+        # Returns the existing job when one with the same key is still
+        # running or finished successfully within result_ttl, so a rerun
+        # picks up its result instead of starting the work again
+        with self._lock:
+            self._prune()
+            existing = self._jobs.get(self._by_key.get(key)) if key else None
+            if existing is not None and existing.status not in (FAILED, CANCELLED):
+                return existing
+            limit = self.max_active_per_user
+            if owner is not None and len(self.active(owner)) >= limit:
+                raise JobLimitError(
+                    f"You already have {limit} jobs running; "
+                    "wait for one to finish."
+                )
+
+            job = Job(kind, owner, key, label or getattr(fn, "__name__", kind))
+            if kind == "cpu":
+                future = self._process_pool().submit(
+                    _run_in_process, job.id, fn, args, kwargs
+                )
+            else:
+                future = self._thread_pool().submit(
+                    _run_in_thread, job, fn, args, kwargs
+                )
+            job._future = future
+            self._jobs[job.id] = job
+            if key:
+                self._by_key[key] = job.id
+        metrics.count("jobs_submitted_total", kind=kind)
+        future.add_done_callback(lambda future: self._finish(job, future))
+        return job
+
+    def submit_io(self, fn, *args, **kwargs):
+        return self.submit("io", fn, *args, **kwargs)
+
+    def submit_cpu(self, fn, *args, **kwargs):
+        # fn and its arguments must be picklable (module-level functions)
+        return self.submit("cpu", fn, *args, **kwargs)
+
+    def _finish(self, job, future):
+        if future.cancelled():
+            status, error = CANCELLED, None
+        else:
+            error = future.exception()
+            if isinstance(error, JobCancelled):
+                status, error = CANCELLED, None
+            elif error is not None:
+                status = FAILED
+            elif job.kind == "cpu" and job.cancel_requested:
+                # A running worker process cannot be interrupted; its
+                # result is dropped instead
+                status = CANCELLED
+            else:
+                status = DONE
+                job.result = future.result()
+                job.progress = 1.0
+        if job._started is not None:
+            elapsed = time.perf_counter() - job._started
+            metrics.observe("job_seconds", elapsed, status == DONE, kind=job.kind)
+        job.error = error
+        job.finished_at = time.time()
+        job.status = status
+        job._finished.set()
+
+    def get(self, job_id):
+        if job_id is None:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout=None):
+        # Blocks until the job has finished and its status is final; returns
+        # the job, or None for an unknown id. Raises TimeoutError.
+        job = self.get(job_id)
+        if job is not None and not job._finished.wait(timeout):
+            raise TimeoutError(f"Job {job.label!r} still running after {timeout}s")
+        return job
+
+    def cancel(self, job_id):
+        # Queued jobs never start. Running thread jobs stop at their next
+        # report(); running process jobs finish but their result is dropped.
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job._cancel.set()
+        job._future.cancel()
+        return True
+
+    def active(self, owner):
+        return [
+            job
+            for job in self._jobs.values()
+            if job.owner == owner and not job.finished
+        ]
+
+
+# Shared by every Streamlit session in the process
+runner = JobRunner()
+submit_io = runner.submit_io
+submit_cpu = runner.submit_cpu
+get = runner.get
+wait = runner.wait
+cancel = runner.cancel
@@ -0,0 +1,196 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+# Set metrics=off to turn instrumentation into no-ops: timer() then hands
+# back a shared null context and timed() returns the function unwrapped
+ENABLED = os.getenv("metrics", "on").lower() not in ("0", "off", "false", "no")
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+RECENT_SAMPLES = 1000
+
+_NULL = contextlib.nullcontext()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+        # Cumulative counts as Prometheus expects; the last bucket is +Inf
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, seconds, ok=True):
+        self.count += 1
+        self.sum += seconds
+        self.errors += 0 if ok else 1
+        for i in range(bisect_left(BUCKETS, seconds), len(self.buckets)):
+            self.buckets[i] += 1
+        self.recent.append(seconds)
+
+    def summary(self):
+        samples = sorted(self.recent)
+
+        def percentile_ms(q):
+            if not samples:
+                return None
+            return samples[min(int(len(samples) * q), len(samples) - 1)] * 1000
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "sum_s": self.sum,
+            "mean_ms": self.sum / self.count * 1000 if self.count else None,
+            "p50_ms": percentile_ms(0.50),
+            "p95_ms": percentile_ms(0.95),
+            "p99_ms": percentile_ms(0.99),
+        }
+
+
+class Registry:
+    # Process-wide timings and counters, shared by every session
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._journal = None
+
+    def observe(self, name, seconds, ok=True, **labels):
+        if not ENABLED:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds, ok)
+            if self._journal is not None:
+                self._journal.append(("observe", name, labels, seconds, ok))
+
+    def count(self, name, value=1, **labels):
+        if not ENABLED:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            if self._journal is not None:
+                self._journal.append(("count", name, labels, value, True))
+
+    def journal(self):
+        # Starts recording every observation and count, and returns what
+        # was recorded since the previous call. jobs.py uses it to carry a
+        # worker process's metrics back to the app's registry.
+        with self._lock:
+            entries, self._journal = self._journal or [], []
+        return entries
+
+    def replay(self, entries):
+        for kind, name, labels, value, ok in entries:
+            if kind == "observe":
+                self.observe(name, value, ok, **labels)
+            else:
+                self.count(name, value, **labels)
+
+    @contextlib.contextmanager
+    def _timer(self, name, labels):
+        # Only exceptions count as errors; Streamlit's rerun/stop signals
+        # derive from BaseException and leave the timing marked ok
+        start = time.perf_counter()
+        ok = True
+        try:
+            yield
+        except Exception:
+            ok = False
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, ok, **labels)
+
+    def timer(self, name, **labels):
+        if not ENABLED:
+            return _NULL
+        return self._timer(name, labels)
+
+    def timed(self, name, **labels):
+        def decorate(fn):
+            if not ENABLED:
+                return fn
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self._timer(name, labels):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorate
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "timers": [
+                    {"name": name, "labels": dict(labels), **histogram.summary()}
+                    for (name, labels), histogram in sorted(self._histograms.items())
+                ],
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self._counters.items())
+                ],
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        # Prometheus text exposition format (version 0.0.4)
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} histogram")
+                    seen.add(name)
+                bounds = [*map(str, BUCKETS), "+Inf"]
+                for bound, count in zip(bounds, histogram.buckets):
+                    bucket_labels = _label_text([*labels, ("le", bound)])
+                    lines.append(f"{name}_bucket{bucket_labels} {count}")
+                lines.append(f"{name}_sum{_label_text(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_label_text(labels)} {histogram.count}")
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} counter")
+                    seen.add(name)
+                lines.append(f"{name}{_label_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+registry = Registry()
+observe = registry.observe
+timer = registry.timer
+timed = registry.timed
+count = registry.count
@@ -0,0 +1,342 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import pickle
+import re
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import make_column_transformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import r2_score
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+import jobs
+import metrics
+from data import BASE_DIR, DATA_PATH, data_fingerprint, load_cars
+
+MODEL_DIR = os.path.join(BASE_DIR, "models")
+CURRENT_FILE = os.path.join(MODEL_DIR, "current.json")
+
+# Bump when the pipeline layout changes so old artifacts are not reused
+SCHEMA_VERSION = 1
+# Published model versions kept besides the current one. Older ones are
+# deleted on publish, with every other file saved for them (price surfaces).
+KEEP_PREVIOUS = int(os.getenv("keep_model_versions", "2"))
+VERSIONED_FILE = re.compile(r"-([0-9a-f]{12})\.")
+
+CATEGORICAL_FEATURES = [
+    "fuel",
+    "seller_type",
+    "transmission",
+    "Brand",
+    "Model",
+    "previous_owners",
+]
+FEATURES = [
+    "fuel",
+    "seller_type",
+    "transmission",
+    "previous_owners",
+    "Brand",
+    "Model",
+    "year_built",
+    "km_driven",
+]
+TARGET = "Price"
+
+DEFAULT_PARAMS = {
+    "n_estimators": 100,
+    "max_depth": None,
+    "min_samples_leaf": 1,
+    "max_features": 1.0,
+    "random_state": 42,
+    "test_size": 0.2,
+}
+
+_lock = threading.Lock()
+_loaded = {
+    "version": None,
+    "pipe": None,
+    "meta": None,
+    "current_mtime": None,
+    "fingerprint": None,
+}
+# (model version, data fingerprint) -> whether the data still holds every
+# row the model was trained on
+_covers = {}
+
+
+def model_version(fingerprint, params):
+    payload = json.dumps(
+        {"schema": SCHEMA_VERSION, "data": fingerprint, "params": params},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:12]
+
+
+def resolve_params(params=None):
+    resolved = dict(DEFAULT_PARAMS)
+    if params:
+        unknown = set(params) - set(DEFAULT_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown hyperparameters: {sorted(unknown)}")
+        resolved.update(params)
+    return resolved
+
+
+# Pipeline
+def build_pipeline(params=None):
+    params = resolve_params(params)
+    column_trans = make_column_transformer(
+        (OneHotEncoder(handle_unknown="ignore"), CATEGORICAL_FEATURES),
+        remainder="passthrough",
+    )
+    rf = RandomForestRegressor(
+        n_estimators=params["n_estimators"],
+        max_depth=params["max_depth"],
+        min_samples_leaf=params["min_samples_leaf"],
+        max_features=params["max_features"],
+        random_state=params["random_state"],
+        n_jobs=-1,
+    )
+    return make_pipeline(column_trans, rf)
+
+
+def load_training_data(path=DATA_PATH):
+    car = load_cars(path)
+    return car[FEATURES], car[TARGET]
+
+
+def row_hashes(X, y):
+    # 64-bit hash per listing, used to tell which rows a model has seen
+    dtypes = {col: "int64" for col in FEATURES if col not in CATEGORICAL_FEATURES}
+    dtypes.update({col: str for col in CATEGORICAL_FEATURES})
+    frame = X.astype(dtypes).assign(**{TARGET: y.astype("int64")})
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+# Artifact store
+def artifact_paths(version):
+    return (
+        os.path.join(MODEL_DIR, f"price_model-{version}.pkl"),
+        os.path.join(MODEL_DIR, f"price_model-{version}.json"),
+    )
+
+
+def rows_path(version):
+    return os.path.join(MODEL_DIR, f"price_model-{version}.rows.npy")
+
+
+def read_rows(version):
+    # Sorted hashes of the rows the model was trained or scored on, or None
+    # for artifacts published before rows were tracked
+    try:
+        return np.load(rows_path(version))
+    except FileNotFoundError:
+        return None
+
+
+def _write_atomic(path, data, mode="w"):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, mode) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def read_current():
+    try:
+        with open(CURRENT_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def publish_rows(version, rows):
+    buffer = io.BytesIO()
+    np.save(buffer, np.unique(rows))
+    _write_atomic(rows_path(version), buffer.getvalue(), mode="wb")
+
+
+def publish(pipe, meta, rows=None):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    model_path, meta_path = artifact_paths(meta["version"])
+    _write_atomic(model_path, pickle.dumps(pipe), mode="wb")
+    if rows is not None:
+        publish_rows(meta["version"], rows)
+    _write_atomic(meta_path, json.dumps(meta, indent=2))
+    # The pointer is swapped last so readers never see a half-written model
+    _write_atomic(CURRENT_FILE, json.dumps(meta, indent=2))
+    prune_artifacts()
+    return meta
+
+
+def prune_artifacts(keep=KEEP_PREVIOUS):
+    # Deletes the files of all but the current and the `keep` most recently
+    # published model versions; returns the deleted file names. Files of
+    # other version schemes (compact exports) are left alone.
+    current = (read_current() or {}).get("version")
+    published = sorted(
+        (
+            (os.path.getmtime(os.path.join(MODEL_DIR, name)), name[12:-5])
+            for name in os.listdir(MODEL_DIR)
+            if name.startswith("price_model-") and name.endswith(".json")
+        ),
+        reverse=True,
+    )
+    previous = [version for _, version in published if version != current]
+    pruned = set(previous[keep:])
+    removed = []
+    for name in os.listdir(MODEL_DIR):
+        match = VERSIONED_FILE.search(name)
+        if match and match.group(1) in pruned:
+            try:
+                os.remove(os.path.join(MODEL_DIR, name))
+                removed.append(name)
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def train(params=None, data_path=DATA_PATH, force=False):
+    params = resolve_params(params)
+    fingerprint = data_fingerprint(data_path)
+    version = model_version(fingerprint, params)
+
+    model_path, meta_path = artifact_paths(version)
+    if not force and os.path.exists(model_path) and os.path.exists(meta_path):
+        # Already trained once; just point the registry back at it
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if (read_current() or {}).get("version") != version:
+            _write_atomic(CURRENT_FILE, json.dumps(meta, indent=2))
+        return meta
+
+    jobs.report(0.05, "Loading training data...")
+    X, y = load_training_data(data_path)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=params["test_size"], random_state=params["random_state"]
+    )
+    pipe = build_pipeline(params)
+    jobs.report(0.1, "Fitting the model...")
+    with metrics.timer("model_fit_seconds"):
+        pipe.fit(X_train, y_train)
+    jobs.report(0.9, "Scoring and publishing...")
+    score = r2_score(y_test, pipe.predict(X_test))
+
+    meta = {
+        "version": version,
+        "data_fingerprint": fingerprint,
+        "params": params,
+        "r2_score": float(score),
+        "train_rows": int(len(X_train)),
+        "trained_at": datetime.now().isoformat(),
+    }
+    return publish(pipe, meta, rows=row_hashes(X, y))
+
+
+def covers_data(current, data_path=DATA_PATH):
+    # True when the data has only grown since the model was published: every
+    # row it was trained on is still there. The added rows are left for
+    # incremental.update() rather than triggering a full refit.
+    fingerprint = data_fingerprint(data_path)
+    if current["data_fingerprint"] == fingerprint:
+        return True
+    key = (current["version"], fingerprint)
+    if key not in _covers:
+        seen = read_rows(current["version"])
+        if seen is None:
+            _covers[key] = False
+        else:
+            X, y = load_training_data(data_path)
+            _covers[key] = bool(np.isin(seen, row_hashes(X, y)).all())
+    return _covers[key]
+
+
+def model_ready(data_path=DATA_PATH, current=None):
+    # True when the published model can serve the data, i.e. when
+    # ensure_model() and load_model() return without training
+    current = current or read_current()
+    return bool(current) and (
+        os.path.exists(artifact_paths(current["version"])[0])
+        and covers_data(current, data_path)
+    )
+
+
+def ensure_model(params=None, data_path=DATA_PATH):
+    # Retrains only when rows were removed or changed, or the hyperparameters
+    # changed; without explicit params the published model (which may have
+    # been updated incrementally) is kept for as long as model_ready() holds
+    current = read_current()
+    if params is None and current:
+        if model_ready(data_path, current):
+            return current
+        params = current["params"]
+    fingerprint = data_fingerprint(data_path)
+    params = resolve_params(params)
+    version = model_version(fingerprint, params)
+    if current and current["version"] == version:
+        if os.path.exists(artifact_paths(version)[0]):
+            return current
+    return train(params, data_path)
+
+
+def load_model():
+    # Process-wide cache; reloads only when the published pointer changes or
+    # the training data changes in a way ensure_model() retrains for
+    with _lock:
+        try:
+            current_mtime = os.stat(CURRENT_FILE).st_mtime_ns
+        except FileNotFoundError:
+            current_mtime = None
+
+        if (
+            _loaded["pipe"] is not None
+            and current_mtime == _loaded["current_mtime"]
+            and data_fingerprint() == _loaded["fingerprint"]
+        ):
+            return _loaded["pipe"], _loaded["meta"]
+
+        meta = ensure_model()
+        if meta["version"] != _loaded["version"]:
+            model_path, _ = artifact_paths(meta["version"])
+            with metrics.timer("model_load_seconds"), open(model_path, "rb") as f:
+                _loaded["pipe"] = pickle.load(f)
+            _loaded["version"] = meta["version"]
+        _loaded["meta"] = meta
+        _loaded["current_mtime"] = os.stat(CURRENT_FILE).st_mtime_ns
+        _loaded["fingerprint"] = data_fingerprint()
+        return _loaded["pipe"], _loaded["meta"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the PriceMyRide price model")
+    parser.add_argument("--force", action="store_true", help="retrain even if cached")
+    parser.add_argument("--n-estimators", type=int)
+    parser.add_argument("--max-depth", type=int)
+    parser.add_argument("--min-samples-leaf", type=int)
+    parser.add_argument("--random-state", type=int)
+    args = parser.parse_args()
+
+    params = {
+        key: value
+        for key, value in {
+            "n_estimators": args.n_estimators,
+            "max_depth": args.max_depth,
+            "min_samples_leaf": args.min_samples_leaf,
+            "random_state": args.random_state,
+        }.items()
+        if value is not None
+    }
+    meta = train(params, force=args.force)
+    print(json.dumps(meta, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import threading
+from types import MappingProxyType
+
+from data import DATA_PATH, data_fingerprint, load_cars
+
+_lock = threading.Lock()
+_cached = {"fingerprint": None, "index": None}
+
+
+def _freeze(groups):
+    return MappingProxyType(
+        {key: tuple(sorted(values)) for key, values in sorted(groups.items())}
+    )
+
+
+class OptionIndex:
+    # Sorted, de-duplicated dropdown choices for the Predictions form, built
+    # once per dataset version so every lookup is a dictionary access
+
+    def __init__(self, car):
+        combos = (
+            car[["Brand", "Model", "fuel", "transmission"]]
+            .astype(str)
+            .drop_duplicates()
+            .itertuples(index=False, name=None)
+        )
+        models, fuels, transmissions = {}, {}, {}
+        for brand, model, fuel, transmission in combos:
+            models.setdefault(brand, set()).add(model)
+            fuels.setdefault((brand, model), set()).add(fuel)
+            transmissions.setdefault((brand, model), set()).add(transmission)
+
+        self.brands = tuple(sorted(models))
+        self.seller_types = tuple(sorted(car["seller_type"].astype(str).unique()))
+        self.models_by_brand = _freeze(models)
+        self.fuels_by_model = _freeze(fuels)
+        self.transmissions_by_model = _freeze(transmissions)
+
+    def models(self, brand):
+        return self.models_by_brand.get(brand, ())
+
+    def fuels(self, brand, model):
+        return self.fuels_by_model.get((brand, model), ())
+
+    def transmissions(self, brand, model):
+        return self.transmissions_by_model.get((brand, model), ())
+
+
+def get_option_index(path=DATA_PATH):
+    fingerprint = data_fingerprint(path)
+    with _lock:
+        if _cached["fingerprint"] != fingerprint:
+            _cached["index"] = OptionIndex(load_cars(path))
+            _cached["fingerprint"] = fingerprint
+        return _cached["index"]
@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from model import CATEGORICAL_FEATURES, FEATURES
+
+DEFAULT_MAXSIZE = 4096
+
+
+def normalize(frame):
+    # The normalized frame is what gets predicted, so cached and live
+    # answers for the same key always agree
+    normalized = frame[FEATURES].copy()
+    for col in CATEGORICAL_FEATURES:
+        normalized[col] = normalized[col].astype(str).str.strip()
+    normalized["year_built"] = normalized["year_built"].astype("int64")
+    normalized["km_driven"] = normalized["km_driven"].astype("int64")
+    return normalized
+
+
+class PredictionCache:
+    # Bounded LRU of predictions keyed by (model version, key): the feature
+    # tuple for a price, or the feature tuple plus quantiles for a price
+    # range (price_range.price_ranges). Entries for an older model version
+    # are dropped as soon as a newer version is seen.
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, version, key):
+        with self._lock:
+            self._check_version(version)
+            price = self._entries.get((version, key))
+            if price is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((version, key))
+            self.hits += 1
+            return price
+
+    def put(self, version, key, price):
+        with self._lock:
+            self._check_version(version)
+            self._entries[(version, key)] = price
+            self._entries.move_to_end((version, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def lookup(self, normalized, version):
+        # Returns the row keys, prices (NaN where missing) and missing rows
+        keys = list(normalized.itertuples(index=False, name=None))
+        prices = np.full(len(keys), np.nan)
+        missing = []
+        for i, key in enumerate(keys):
+            price = self.get(version, key)
+            if price is None:
+                missing.append(i)
+            else:
+                prices[i] = price
+        return keys, prices, missing
+
+    def store(self, version, keys, missing, predicted):
+        for i, price in zip(missing, predicted):
+            self.put(version, keys[i], float(price))
+
+    def predict(self, frame, pipe, version):
+        # Looks every row up, then predicts all misses in one call
+        normalized = normalize(frame)
+        keys, prices, missing = self.lookup(normalized, version)
+        if missing:
+            predicted = pipe.predict(normalized.iloc[missing])
+            prices[missing] = predicted
+            self.store(version, keys, missing, predicted)
+        return prices
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "version": self._version,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+# Shared by every Streamlit session, batch job and API request in the process
+prediction_cache = PredictionCache()
+
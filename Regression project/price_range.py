@@ -0,0 +1,77 @@
+import threading
+
+import numpy as np
+
+from model import load_model
+from prediction_cache import normalize, prediction_cache
+
+# Spread of the individual trees' estimates: the 10th and 90th percentile
+# tree by default. This describes how much the trees disagree, not a
+# calibrated confidence interval.
+DEFAULT_QUANTILES = (0.1, 0.9)
+
+_lock = threading.Lock()
+_tables = {}
+
+
+class LeafTable:
+    # Every tree's leaf values stacked into one (trees x nodes) matrix, so
+    # per-tree predictions for any number of rows are a single fancy-index
+    # lookup on the leaf indices returned by forest.apply()
+
+    def __init__(self, forest):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        self.values = np.zeros((len(trees), max(tree.node_count for tree in trees)))
+        for i, tree in enumerate(trees):
+            self.values[i, : tree.node_count] = tree.value[:, 0, 0]
+        self._tree_index = np.arange(len(trees))
+
+    def per_tree(self, forest, X):
+        leaves = forest.apply(X)
+        return self.values[self._tree_index, leaves]
+
+
+def leaf_table(pipe, version):
+    # One table per model version, built on first use
+    with _lock:
+        table = _tables.get(version)
+        if table is None:
+            _tables.clear()
+            table = _tables[version] = LeafTable(pipe[-1])
+        return table
+
+
+def predict_ranges(frame, pipe, version, quantiles=DEFAULT_QUANTILES):
+    # Returns (point estimates, array of shape (rows, len(quantiles))). The
+    # point estimate is the mean over trees, i.e. exactly pipe.predict().
+    X = pipe[:-1].transform(frame)
+    per_tree = leaf_table(pipe, version).per_tree(pipe[-1], X)
+    return per_tree.mean(axis=1), np.quantile(per_tree, quantiles, axis=1).T
+
+
+def price_ranges(frame, quantiles=DEFAULT_QUANTILES, cache=prediction_cache):
+    # Live point estimates and bounds, looked up in the shared prediction
+    # cache first under the row plus the quantiles asked for
+    pipe, meta = load_model()
+    version = meta["version"]
+    normalized = normalize(frame)
+    keys = [
+        (*row, *quantiles) for row in normalized.itertuples(index=False, name=None)
+    ]
+    result = np.full((len(keys), len(quantiles) + 1), np.nan)
+    missing = []
+    for i, key in enumerate(keys):
+        cached = cache.get(version, key)
+        if cached is None:
+            missing.append(i)
+        else:
+            result[i] = cached
+    if missing:
+        mean, bounds = predict_ranges(
+            normalized.iloc[missing], pipe, version, quantiles
+        )
+        result[missing, 0] = mean
+        result[missing, 1:] = bounds
+        for i in missing:
+            cache.put(version, keys[i], result[i].copy())
+    return result[:, 0], result[:, 1:]
@@ -0,0 +1,304 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import jobs
+import metrics
+from data import DATA_PATH, load_cars
+from model import FEATURES, MODEL_DIR, _write_atomic, load_model
+from prediction_cache import normalize
+from price_range import predict_ranges, price_ranges
+
+# The grid mirrors the Predictions form: every Brand/Model/fuel/transmission
+# seen in the data, crossed with every seller type and owner count the form
+# offers, for each year it accepts and at these round mileages.
+#
+# Only queries on a grid point are answered from the surface, so its answers
+# are exactly the live model's. Interpolating between mileages would cover
+# every query, but the forest is piecewise constant in km and linear
+# interpolation was off by up to 19% (median 0.08%); every other query is
+# answered by the live model through the prediction cache instead.
+YEARS = tuple(range(2000, 2025))
+OWNERS = ("Zero", "One", "Two")
+KM_POINTS = (
+    0,
+    5_000,
+    10_000,
+    20_000,
+    30_000,
+    40_000,
+    50_000,
+    60_000,
+    70_000,
+    80_000,
+    90_000,
+    100_000,
+    120_000,
+    140_000,
+    160_000,
+    180_000,
+    200_000,
+    250_000,
+    300_000,
+    400_000,
+    500_000,
+)
+# Tree-estimate quantiles stored next to the mean: the bounds of the 50%,
+# 80% and 90% ranges offered on the Predictions page
+QUANTILES = (0.05, 0.1, 0.25, 0.75, 0.9, 0.95)
+BATCH_SIZE = 50_000
+
+_lock = threading.Lock()
+_loaded = {"version": None, "surface": None}
+
+
+def surface_paths(version):
+    return (
+        os.path.join(MODEL_DIR, f"price_surface-{version}.npy"),
+        os.path.join(MODEL_DIR, f"price_surface-{version}.json"),
+    )
+
+
+class PriceSurface:
+    # Model answers for the whole grid in one float32 array of shape
+    # (combos, seller types, owners, years, mileages, 1 + quantiles); the
+    # first value of the last axis is the point estimate. Saved as a .npy
+    # that is memory-mapped on load, so only the cells asked for are read.
+
+    def __init__(self, version, combos, seller_types, values):
+        self.version = version
+        self.combos = combos
+        self.seller_types = tuple(seller_types)
+        self.values = values
+        self._combo_index = {combo: i for i, combo in enumerate(combos)}
+        self._seller_index = {name: i for i, name in enumerate(self.seller_types)}
+        self._owner_index = {name: i for i, name in enumerate(OWNERS)}
+        self._km_index = {km: i for i, km in enumerate(KM_POINTS)}
+        self._quantile_index = {q: i + 1 for i, q in enumerate(QUANTILES)}
+
+    @property
+    def cells(self):
+        return int(np.prod(self.values.shape[:-1]))
+
+    def columns(self, quantiles):
+        # Positions of the point estimate and the requested quantiles on the
+        # last axis, or None when a quantile was not precomputed
+        try:
+            return [0] + [self._quantile_index[round(q, 6)] for q in quantiles]
+        except KeyError:
+            return None
+
+    def cell(self, row, columns):
+        # One normalized feature tuple, in FEATURES order, to its stored
+        # values; None when the row is not on a grid point
+        fuel, seller, transmission, owners, brand, model, year, km = row
+        combo = self._combo_index.get((brand, model, fuel, transmission))
+        s = self._seller_index.get(seller)
+        o = self._owner_index.get(owners)
+        k = self._km_index.get(km)
+        y = year - YEARS[0]
+        if None in (combo, s, o, k) or not 0 <= y < len(YEARS):
+            return None
+        return self.values[combo, s, o, y, k, columns]
+
+    def lookup(self, normalized, quantiles=()):
+        # Returns an array of shape (rows, 1 + quantiles), NaN where off-grid
+        result = np.full((len(normalized), len(quantiles) + 1), np.nan)
+        columns = self.columns(quantiles)
+        if columns is None:
+            return result
+        rows = normalized[FEATURES].itertuples(index=False, name=None)
+        for i, row in enumerate(rows):
+            values = self.cell(row, columns)
+            if values is not None:
+                result[i] = values
+        return result
+
+    def save(self, values_path, meta_path):
+        tmp_path = f"{values_path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, self.values)
+        os.replace(tmp_path, values_path)
+        meta = {
+            "version": self.version,
+            "combos": self.combos,
+            "seller_types": self.seller_types,
+            "owners": OWNERS,
+            "years": YEARS,
+            "km": KM_POINTS,
+            "quantiles": QUANTILES,
+        }
+        _write_atomic(meta_path, json.dumps(meta))
+
+    @classmethod
+    def load(cls, values_path, meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        # A surface saved for a different grid is treated as missing
+        axes = (meta["owners"], meta["years"], meta["km"], meta["quantiles"])
+        if axes != tuple(map(list, (OWNERS, YEARS, KM_POINTS, QUANTILES))):
+            return None
+        return cls(
+            meta["version"],
+            [tuple(combo) for combo in meta["combos"]],
+            meta["seller_types"],
+            np.load(values_path, mmap_mode="r"),
+        )
+
+
+def grid_axes(car):
+    combos = sorted(
+        car[["Brand", "Model", "fuel", "transmission"]]
+        .astype(str)
+        .drop_duplicates()
+        .itertuples(index=False, name=None)
+    )
+    seller_types = sorted(car["seller_type"].astype(str).unique())
+    return combos, seller_types
+
+
+def grid_frame(combos, seller_types):
+    # Every grid cell as a model input row, in the C order of the value array
+    axes = (combos, seller_types, OWNERS, YEARS, KM_POINTS)
+    index = np.indices([len(axis) for axis in axes]).reshape(len(axes), -1)
+    combo_columns = np.array(combos, dtype=object).reshape(-1, 4)[index[0]]
+    return pd.DataFrame(
+        {
+            "fuel": combo_columns[:, 2],
+            "seller_type": np.array(seller_types, dtype=object)[index[1]],
+            "transmission": combo_columns[:, 3],
+            "previous_owners": np.array(OWNERS, dtype=object)[index[2]],
+            "Brand": combo_columns[:, 0],
+            "Model": combo_columns[:, 1],
+            "year_built": np.array(YEARS)[index[3]],
+            "km_driven": np.array(KM_POINTS)[index[4]],
+        }
+    )
+
+
+def build(pipe, version, data_path=DATA_PATH, batch_size=BATCH_SIZE):
+    # The grid is generated a few combos at a time so only one batch of
+    # input rows and per-tree estimates is in memory at once
+    combos, seller_types = grid_axes(load_cars(data_path))
+    shape = (len(combos), len(seller_types), len(OWNERS), len(YEARS), len(KM_POINTS))
+    values = np.empty((*shape, len(QUANTILES) + 1), dtype=np.float32)
+    step = max(1, batch_size // int(np.prod(shape[1:])))
+    for start in range(0, len(combos), step):
+        jobs.report(start / len(combos), "Evaluating the price grid...")
+        batch = grid_frame(combos[start : start + step], seller_types)
+        mean, bounds = predict_ranges(batch, pipe, version, QUANTILES)
+        block = values[start : start + step].reshape(len(batch), -1)
+        block[:, 0] = mean
+        block[:, 1:] = bounds
+    return PriceSurface(version, combos, seller_types, values)
+
+
+def export(force=False):
+    # Builds and saves the surface for the published model
+    pipe, meta = load_model()
+    paths = surface_paths(meta["version"])
+    if not force and all(map(os.path.exists, paths)):
+        return paths
+    with metrics.timer("price_surface_build_seconds"):
+        surface = build(pipe, meta["version"])
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    surface.save(*paths)
+    return paths
+
+
+def load_surface(version):
+    # Process-wide cache. A version without a saved surface is built once as
+    # a CPU job; until it lands, callers get None and use the live model.
+    with _lock:
+        if _loaded["version"] == version:
+            return _loaded["surface"]
+        paths = surface_paths(version)
+        if all(map(os.path.exists, paths)):
+            surface = PriceSurface.load(*paths)
+            if surface is not None:
+                _loaded["version"], _loaded["surface"] = version, surface
+                return surface
+        jobs.submit_cpu(
+            export, key=("price_surface", version), label="Building the price surface"
+        )
+        return None
+
+
+@metrics.timed("surface_predict_seconds")
+def predict_with_ranges(frame, quantiles=()):
+    # Point estimates and quantile bounds from the surface, with off-grid
+    # rows (and everything while the surface is being built) answered by
+    # the live model through the prediction cache
+    _, meta = load_model()
+    normalized = normalize(frame)
+    surface = load_surface(meta["version"])
+    if surface is None:
+        result = np.full((len(normalized), len(quantiles) + 1), np.nan)
+    else:
+        result = surface.lookup(normalized, quantiles)
+    missing = np.flatnonzero(np.isnan(result[:, 0]))
+    metrics.count("price_surface_rows_total", len(frame) - len(missing), hit=True)
+    metrics.count("price_surface_rows_total", len(missing), hit=False)
+    if len(missing):
+        mean, bounds = price_ranges(normalized.iloc[missing], quantiles)
+        result[missing, 0] = mean
+        result[missing, 1:] = bounds
+    return result[:, 0], result[:, 1:]
+
+
+def _normalize_row(row):
+    # prediction_cache.normalize() for a single tuple in FEATURES order,
+    # without building a DataFrame
+    *categorical, year, km = row
+    return (*(str(value).strip() for value in categorical), int(year), int(km))
+
+
+@metrics.timed("surface_predict_one_seconds")
+def predict_one(row, quantiles=()):
+    # Fast path for the Predictions page's single query: row is a tuple in
+    # FEATURES order, and an on-grid hit is a few dict lookups and one array
+    # read. Returns (point estimate, array of quantile bounds).
+    _, meta = load_model()
+    row = _normalize_row(row)
+    surface = load_surface(meta["version"])
+    if surface is not None:
+        columns = surface.columns(quantiles)
+        values = None if columns is None else surface.cell(row, columns)
+        if values is not None:
+            metrics.count("price_surface_rows_total", hit=True)
+            return float(values[0]), np.asarray(values[1:], dtype=float)
+    metrics.count("price_surface_rows_total", hit=False)
+    mean, bounds = price_ranges(pd.DataFrame([row], columns=FEATURES), quantiles)
+    return float(mean[0]), bounds[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Precompute the price surface for the published model"
+    )
+    parser.add_argument("--force", action="store_true", help="rebuild even if saved")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    paths = export(force=args.force)
+    surface = PriceSurface.load(*paths)
+    print(
+        json.dumps(
+            {
+                "path": paths[0],
+                "version": surface.version,
+                "cells": surface.cells,
+                "size_mb": sum(map(os.path.getsize, paths)) / 1e6,
+                "seconds": time.perf_counter() - start,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+import atexit
+import functools
+import json
+import os
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+
+import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REPLICA_PATH = os.getenv("replica_path", os.path.join(BASE_DIR, "replica.sqlite3"))
+PAGE_SIZE = 10
+# Queued writes go out as one multi-location update of up to BATCH_SIZE
+# paths, sent at most FLUSH_INTERVAL seconds after the first one was queued
+BATCH_SIZE = 100
+FLUSH_INTERVAL = 0.5
+# A failed batch is retried after 0.5, 1, 2 and 4 seconds before it is
+# given up on
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 0.5
+
+# Mirrored nodes, and the fields copied out of each child into indexed
+# columns; the whole child is kept as JSON in `data`
+NODES = {
+    "car_info": ("uploaded_on", "user_handle"),
+    "users": ("handle",),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS car_info (
+    key TEXT PRIMARY KEY,
+    uploaded_on TEXT NOT NULL,
+    user_handle TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS car_info_uploaded_on ON car_info (uploaded_on, key);
+CREATE INDEX IF NOT EXISTS car_info_user_handle
+    ON car_info (user_handle, uploaded_on, key);
+CREATE TABLE IF NOT EXISTS users (
+    key TEXT PRIMARY KEY,
+    handle TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    node TEXT PRIMARY KEY,
+    synced_at REAL NOT NULL
+);
+"""
+
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+_lock = threading.RLock()
+_shared = {"replica": None, "writer": None}
+
+
+def push_id():
+    # Firebase-style push key: 8 characters of millisecond timestamp, so keys
+    # sort by creation time, then 12 random ones. Made locally so a queued
+    # write already knows the key it will be stored under.
+    now = int(time.time() * 1000)
+    stamp = ""
+    for _ in range(8):
+        now, digit = divmod(now, 64)
+        stamp = PUSH_CHARS[digit] + stamp
+    return stamp + "".join(secrets.choice(PUSH_CHARS) for _ in range(12))
+
+
+def _split(path):
+    return [part for part in path.strip("/").split("/") if part]
+
+
+def _set_nested(node, parts, value):
+    # Sets (or with None removes) node[parts[0]][parts[1]]...
+    for part in parts[:-1]:
+        child = node.get(part)
+        if not isinstance(child, dict):
+            child = node[part] = {}
+        node = child
+    if value is None:
+        node.pop(parts[-1], None)
+    else:
+        node[parts[-1]] = value
+
+
+class WriteBehind:
+    # Takes writes off the caller's thread and sends them to Firebase in
+    # batches, as multi-location updates on the root reference. Later writes
+    # to the same path within a batch replace earlier ones.
+
+    def __init__(
+        self,
+        root_ref,
+        batch_size=BATCH_SIZE,
+        flush_interval=FLUSH_INTERVAL,
+        max_attempts=MAX_ATTEMPTS,
+        retry_delay=RETRY_DELAY,
+    ):
+        self._root = root_ref
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.failed = 0
+        self.last_error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="write-behind", daemon=True
+        )
+        self._thread.start()
+
+    def put(self, path, value):
+        self._queue.put(("/".join(_split(path)), value))
+
+    def push(self, node, value):
+        key = push_id()
+        self.put(f"{node}/{key}", value)
+        return key
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def flush(self):
+        # Blocks until every queued write has been sent or given up on
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self):
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while items[-1] is not None and len(items) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._next_batch()
+            writes = dict(item for item in items if item is not None)
+            try:
+                if writes:
+                    self._send(writes)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+            if items[-1] is None:
+                return
+
+    def _send(self, batch):
+        for attempt in range(self.max_attempts):
+            try:
+                with metrics.timer("firebase_update_seconds", path="/"):
+                    self._root.update(batch)
+                metrics.count("replica_writes_total", len(batch))
+                return
+            except Exception as e:
+                self.last_error = e
+                if attempt + 1 < self.max_attempts:
+                    metrics.count("replica_write_retries_total")
+                    time.sleep(self.retry_delay * 2**attempt)
+        self.failed += len(batch)
+        metrics.count("replica_write_failures_total", len(batch))
+
+
+class Replica:
+    # SQLite mirror of the car_info and users nodes, kept current by one
+    # Realtime Database listener per node. Reads never touch Firebase;
+    # writes are applied locally at once and sent through a WriteBehind,
+    # which is left open on close() when it was passed in.
+
+    def __init__(self, root_ref, path=REPLICA_PATH, writer=None):
+        self.path = path
+        self.last_error = None
+        self._root = root_ref
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        # Separate connections so reads do not wait on a sync in progress
+        self._conn = self._connect()
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+        self._reader = self._connect()
+        self._synced = {node: threading.Event() for node in NODES}
+        self._previously_synced = {
+            node for (node,) in self._conn.execute("SELECT node FROM sync_state")
+        }
+        self._listeners = []
+        self._owns_writer = writer is None
+        self.writer = writer or WriteBehind(root_ref)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def start(self):
+        for node in NODES:
+            callback = functools.partial(self._on_event, node)
+            self._listeners.append(self._root.child(node).listen(callback))
+        return self
+
+    def close(self):
+        for registration in self._listeners:
+            registration.close()
+        self._listeners = []
+        if self._owns_writer:
+            self.writer.close()
+        else:
+            self.writer.flush()
+        self._conn.close()
+        self._reader.close()
+
+    def ready(self, node="car_info"):
+        # True once this process has the node's snapshot, or when a snapshot
+        # from an earlier run is on disk (served until the fresh one lands)
+        return self._synced[node].is_set() or node in self._previously_synced
+
+    def wait(self, node="car_info", timeout=None):
+        return self._synced[node].wait(timeout)
+
+    # Sync
+    def _on_event(self, node, event):
+        # Runs on the listener's thread; errors are recorded rather than
+        # raised so the listener keeps running
+        try:
+            with self._write_lock, self._conn:
+                self._apply(node, event.event_type, event.path, event.data)
+                if event.event_type == "put" and not _split(event.path):
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO sync_state VALUES (?, ?)",
+                        (node, time.time()),
+                    )
+        except Exception as e:
+            self.last_error = e
+            metrics.count("replica_event_errors_total", node=node)
+            return
+        metrics.count("replica_events_total", node=node, type=event.event_type)
+        if event.event_type == "put" and not _split(event.path):
+            self._synced[node].set()
+
+    def _apply(self, node, event_type, path, data):
+        # A put replaces the value at path; a patch sets each of its keys
+        parts = _split(path)
+        if event_type == "patch":
+            changes = [(parts + _split(key), value) for key, value in data.items()]
+        else:
+            changes = [(parts, data)]
+        for target, value in changes:
+            if not target:
+                self._conn.execute(f"DELETE FROM {node}")
+                for key, child in (value or {}).items():
+                    self._put_child(node, key, child)
+            elif len(target) == 1:
+                self._put_child(node, target[0], value)
+            else:
+                child = self._get_child(node, target[0]) or {}
+                _set_nested(child, target[1:], value)
+                self._put_child(node, target[0], child or None)
+
+    def _get_child(self, node, key):
+        row = self._conn.execute(
+            f"SELECT data FROM {node} WHERE key = ?", (key,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put_child(self, node, key, value):
+        if value is None:
+            self._conn.execute(f"DELETE FROM {node} WHERE key = ?", (key,))
+            return
+        columns = NODES[node]
+        fields = value if isinstance(value, dict) else {}
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO {node} (key, {', '.join(columns)}, data) "
+            f"VALUES ({', '.join('?' * (len(columns) + 2))})",
+            (
+                key,
+                *(str(fields.get(column) or "") for column in columns),
+                json.dumps(value),
+            ),
+        )
+
+    # Writes
+    def set(self, path, value):
+        # The mirror is updated straight away, so the writer sees the change
+        # on the next rerun; the listener's echo later rewrites the same row
+        parts = _split(path)
+        if parts[0] in NODES:
+            with self._write_lock, self._conn:
+                self._apply(parts[0], "put", "/".join(parts[1:]), value)
+        self.writer.put(path, value)
+
+    def push(self, node, value):
+        key = push_id()
+        self.set(f"{node}/{key}", value)
+        return key
+
+    # Reads
+    def _query(self, sql, params=()):
+        with metrics.timer("replica_query_seconds"), self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def page(self, before=None, page_size=PAGE_SIZE, user_handle=None):
+        # Same contract as community.fetch_page: newest-first entries older
+        # than the (uploaded_on, key) cursor, and the next cursor or None
+        where, params = [], []
+        if user_handle is not None:
+            where.append("user_handle = ?")
+            params.append(user_handle)
+        if before is not None:
+            where.append("(uploaded_on, key) < (?, ?)")
+            params.extend(before)
+        rows = self._query(
+            "SELECT key, uploaded_on, data FROM car_info"
+            + (f" WHERE {' AND '.join(where)}" if where else "")
+            + " ORDER BY uploaded_on DESC, key DESC LIMIT ?",
+            (*params, page_size + 1),
+        )
+        page = [(key, json.loads(data)) for key, _, data in rows[:page_size]]
+        next_cursor = None
+        if len(rows) > page_size:
+            key, uploaded_on, _ = rows[page_size - 1]
+            next_cursor = (uploaded_on, key)
+        return page, next_cursor
+
+    def handles(self):
+        # (user_handle, listings) pairs, most active first
+        return self._query(
+            "SELECT user_handle, COUNT(*) FROM car_info GROUP BY user_handle "
+            "ORDER BY COUNT(*) DESC, user_handle"
+        )
+
+    def counts(self):
+        ((listings, uploaders),) = self._query(
+            "SELECT COUNT(*), COUNT(DISTINCT user_handle) FROM car_info"
+        )
+        ((users,),) = self._query("SELECT COUNT(*) FROM users")
+        return {"listings": listings, "uploaders": uploaders, "users": users}
+
+
+def running_replica():
+    # The process-wide replica if a page that reads the feed has started
+    # it, else None; writers use it when it is there but never start it
+    return _shared["replica"]
+
+
+def get_writer():
+    # Process-wide write-behind queue on the database root. It has no
+    # listeners, so signup and uploads can use it without downloading the
+    # feed; the replica sends its writes through the same queue. Queued
+    # writes are flushed when the process exits.
+    with _lock:
+        if _shared["writer"] is None:
+            from firebase_admin import db
+
+            from firebase_setup import initialize_firebase
+
+            initialize_firebase()
+            writer = WriteBehind(db.reference("/"))
+            atexit.register(writer.flush)
+            _shared["writer"] = writer
+        return _shared["writer"]
+
+
+def get_replica():
+    # Process-wide replica of the app's Firebase database, started on first
+    # use by the pages that read the feed
+    with _lock:
+        if _shared["replica"] is None:
+            writer = get_writer()
+            from firebase_admin import db
+
+            _shared["replica"] = Replica(db.reference("/"), writer=writer).start()
+        return _shared["replica"]
@@ -0,0 +1,227 @@
+import hashlib
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+from identity import IdentityError, client, token_claims
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SESSION_KEY = "auth_session"
+COOKIE_NAME = "pricemyride_session"
+COOKIE_MAX_AGE = 7 * 24 * 3600
+VERIFIED_TTL = 900
+# Comma-separated Firebase uids allowed to see the admin pages
+ADMIN_UIDS = set(filter(None, map(str.strip, os.getenv("admin_uids", "").split(","))))
+SESSION_STORE_PATH = os.getenv(
+    "session_store", os.path.join(BASE_DIR, "sessions.sqlite3")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id_hash TEXT PRIMARY KEY,
+    uid TEXT NOT NULL,
+    handle TEXT NOT NULL,
+    refresh_token TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Identity Toolkit answers that mean the refresh token will never work again,
+# as opposed to timeouts, connection errors and 5xx
+REJECTED_TOKEN_ERRORS = {"INVALID_REFRESH_TOKEN", "TOKEN_EXPIRED", "USER_DISABLED"}
+
+_lock = threading.Lock()
+_verified = {}
+_shared = {"store": None}
+
+
+class TokenRejected(IdentityError):
+    pass
+
+
+def _hash(session_id):
+    return hashlib.sha256(session_id.encode()).hexdigest()
+
+
+class SessionStore:
+    # Server-side half of a login. The cookie holds only a random session
+    # ID; the refresh token stays here, under a hash of that ID, so a copied
+    # cookie stops working once the session is ended.
+
+    def __init__(self, path=SESSION_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def create(self, uid, handle, refresh_token, max_age=COOKIE_MAX_AGE):
+        session_id = secrets.token_urlsafe(32)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+            self._conn.execute(
+                "INSERT INTO sessions VALUES (?, ?, ?, ?, ?)",
+                (_hash(session_id), uid, handle, refresh_token, now + max_age),
+            )
+        return session_id
+
+    def get(self, session_id):
+        # The stored session, or None if it is unknown, ended or expired (or
+        # the cookie is missing or mangled)
+        if not isinstance(session_id, str) or not session_id:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT uid, handle, refresh_token FROM sessions "
+                "WHERE id_hash = ? AND expires_at >= ?",
+                (_hash(session_id), time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("uid", "handle", "refresh_token"), row))
+
+    def update_token(self, session_id, refresh_token):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE sessions SET refresh_token = ? WHERE id_hash = ?",
+                (refresh_token, _hash(session_id)),
+            )
+
+    def delete(self, session_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM sessions WHERE id_hash = ?", (_hash(session_id),)
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+def get_store():
+    with _lock:
+        if _shared["store"] is None:
+            _shared["store"] = SessionStore()
+        return _shared["store"]
+
+
+def remember_user(uid, info):
+    # Process-wide cache of users whose email was verified recently, so a
+    # restored session needs no Identity Toolkit round trip
+    with _lock:
+        _verified[uid] = (time.monotonic() + VERIFIED_TTL, info)
+
+
+def verified_user(uid):
+    with _lock:
+        cached = _verified.get(uid)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        _verified.pop(uid, None)
+        return None
+
+
+def forget_user(uid):
+    with _lock:
+        _verified.pop(uid, None)
+
+
+def _refresh(refresh_token):
+    # One refresh both checks that the account is still valid and yields
+    # its current claims; returns (claims, the new refresh token)
+    resp = client.refresh(refresh_token)
+    if "error" in resp:
+        message = resp["error"].get("message") or f"HTTP {resp['error'].get('code')}"
+        if message.split(":")[0].strip() in REJECTED_TOKEN_ERRORS:
+            raise TokenRejected(message)
+        raise IdentityError(message)
+    return token_claims(resp["id_token"]), resp["refresh_token"]
+
+
+def start_session(login):
+    # Called with the authenticate_user() result after a successful login
+    state = {"uid": login["uid"], "handle": login["handle"]}
+    state["session_id"] = get_store().create(
+        state["uid"], state["handle"], login["refreshToken"]
+    )
+    remember_user(state["uid"], {"handle": state["handle"]})
+    _activate(state)
+    st.session_state["pending_cookie"] = state["session_id"]
+
+
+def _activate(state):
+    st.session_state[SESSION_KEY] = state
+    st.session_state["logged_in"] = True
+    st.session_state["handle"] = state["handle"]
+
+
+def restore_session():
+    # Rebuilds a session from the session cookie after a browser reload.
+    # Returns True if the user is logged in again.
+    session_id = st.context.cookies.get(COOKIE_NAME)
+    store = get_store()
+    stored = store.get(session_id)
+    if stored is None:
+        if session_id:
+            st.session_state["pending_cookie"] = ""
+        return False
+
+    state = {"uid": stored["uid"], "handle": stored["handle"], "session_id": session_id}
+    if verified_user(state["uid"]) is None:
+        # Unknown or stale in this process: check the account again
+        try:
+            claims, refresh_token = _refresh(stored["refresh_token"])
+            verified = claims.get("email_verified", True)
+        except TokenRejected:
+            verified = False
+        except IdentityError:
+            # Timeouts, connection errors, 5xx: keep the stored session so a
+            # later run can restore it, but do not log the user in on this one
+            return False
+        if not verified:
+            store.delete(session_id)
+            end_session()
+            return False
+        store.update_token(session_id, refresh_token)
+        remember_user(state["uid"], {"handle": state["handle"]})
+    _activate(state)
+    return True
+
+
+def current_uid():
+    state = st.session_state.get(SESSION_KEY)
+    return state["uid"] if state else None
+
+
+def is_admin():
+    return current_uid() in ADMIN_UIDS
+
+
+def end_session():
+    state = st.session_state.pop(SESSION_KEY, None)
+    if state is not None:
+        forget_user(state["uid"])
+        get_store().delete(state["session_id"])
+    st.session_state["logged_in"] = False
+    st.session_state.pop("handle", None)
+    st.session_state["pending_cookie"] = ""
+
+
+def sync_cookie():
+    # Cookies are written from the browser, so a pending change is flushed
+    # on the run after it was made (a st.rerun() would drop it otherwise).
+    # The value is only the session ID; the tokens never leave the server.
+    value = st.session_state.pop("pending_cookie", None)
+    if value is None:
+        return
+    max_age = COOKIE_MAX_AGE if value else 0
+    st.iframe(
+        "<script>parent.document.cookie = "
+        f"'{COOKIE_NAME}={value}; Max-Age={max_age}; Path=/; Secure; "
+        "SameSite=Strict';</script>",
+        height=1,
+    )
@@ -0,0 +1,49 @@
+import threading
+
+from data import DATA_PATH, data_fingerprint, load_cars
+
+_lock = threading.Lock()
+_cached = {"fingerprint": None, "cube": None}
+
+QUANTILES = {"q25_price": 0.25, "q75_price": 0.75}
+
+
+def _aggregate(car, keys):
+    prices = car.groupby(keys, observed=True)["Price"]
+    stats = prices.agg(["count", "mean", "min", "max", "median"]).rename(
+        columns={
+            "mean": "avg_price",
+            "min": "min_price",
+            "max": "max_price",
+            "median": "median_price",
+        }
+    )
+    quantiles = prices.quantile(list(QUANTILES.values())).unstack()
+    quantiles.columns = list(QUANTILES)
+    return stats.join(quantiles).sort_index()
+
+
+class StatsCube:
+    # Price statistics per Brand/Model and per Brand/Model/year_built,
+    # computed once per dataset version for the Explore Models page
+
+    def __init__(self, car):
+        self.by_model = _aggregate(car, ["Brand", "Model"])
+        self.by_year = _aggregate(car, ["Brand", "Model", "year_built"])
+
+    def comparison(self, pairs):
+        # pairs is a list of (brand, model) tuples
+        return self.by_model.loc[self.by_model.index.isin(pairs)].reset_index()
+
+    def trend(self, pairs):
+        keys = self.by_year.index.droplevel("year_built")
+        return self.by_year.loc[keys.isin(pairs)].reset_index()
+
+
+def get_stats_cube(path=DATA_PATH):
+    fingerprint = data_fingerprint(path)
+    with _lock:
+        if _cached["fingerprint"] != fingerprint:
+            _cached["cube"] = StatsCube(load_cars(path))
+            _cached["fingerprint"] = fingerprint
+        return _cached["cube"]
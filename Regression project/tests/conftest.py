@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules sit next to this directory rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def model_dir(tmp_path, monkeypatch):
+    # Publishes models to a temporary directory instead of models/
+    import model
+
+    monkeypatch.setattr(model, "MODEL_DIR", str(tmp_path))
+    monkeypatch.setattr(model, "CURRENT_FILE", str(tmp_path / "current.json"))
+    return tmp_path
@@ -0,0 +1,137 @@
+import json
+import threading
+
+import pandas as pd
+import pytest
+import requests
+
+import api
+from batch import BatchValidationError
+
+LISTING = {
+    "fuel": "Petrol",
+    "seller_type": "Individual",
+    "transmission": "Manual",
+    "previous_owners": "One",
+    "Brand": "Maruti",
+    "Model": "Swift",
+    "year_built": 2015,
+    "km_driven": 40000,
+}
+
+
+class FakePipe:
+    # Prices each row at its km_driven, and records the size of every call
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    def predict(self, frame):
+        self.calls.append(len(frame))
+        if self.error is not None:
+            raise self.error
+        return frame["km_driven"].to_numpy(dtype=float)
+
+
+def _frame(*kms):
+    return pd.DataFrame([{**LISTING, "km_driven": km} for km in kms])
+
+
+@pytest.fixture
+def pipe():
+    return FakePipe()
+
+
+def _batcher(pipe, **options):
+    return api.MicroBatcher(loader=lambda: (pipe, {"version": "test"}), **options)
+
+
+def test_concurrent_submits_share_one_model_call(pipe):
+    batcher = _batcher(pipe, max_wait=0.5)
+    try:
+        futures = [batcher.submit(_frame(km)) for km in (1, 2, 3, 4, 5)]
+        results = [future.result(timeout=5) for future in futures]
+    finally:
+        batcher.close()
+    assert pipe.calls == [5]
+    assert [list(prices) for prices, _ in results] == [[1], [2], [3], [4], [5]]
+    assert batcher.batches == 1 and batcher.rows == 5
+
+
+def test_requests_that_would_overflow_a_batch_wait_for_the_next(pipe):
+    batcher = _batcher(pipe, max_batch_size=4, max_wait=0.5)
+    try:
+        frames = [_frame(1, 2, 3), _frame(4, 5, 6), _frame(7, 8)]
+        futures = [batcher.submit(frame) for frame in frames]
+        results = [future.result(timeout=5) for future in futures]
+    finally:
+        batcher.close()
+    # The second and third requests each overflowed and went first in the
+    # following batch through _pending
+    assert pipe.calls == [3, 3, 2]
+    assert [list(prices) for prices, _ in results] == [[1, 2, 3], [4, 5, 6], [7, 8]]
+
+
+def test_model_errors_reach_every_waiting_caller():
+    batcher = _batcher(FakePipe(error=ValueError("model exploded")), max_wait=0.5)
+    try:
+        futures = [batcher.submit(_frame(km)) for km in (1, 2, 3)]
+        for future in futures:
+            with pytest.raises(ValueError, match="model exploded"):
+                future.result(timeout=5)
+    finally:
+        batcher.close()
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        42,
+        [],
+        [1, 2],
+        {"rows": "not a list"},
+        {"fuel": "Petrol"},
+        {**LISTING, "year_built": "new"},
+        {**LISTING, "km_driven": -5},
+        [LISTING, {**LISTING, "Brand": " "}],
+    ],
+)
+def test_parse_rows_rejects_bad_input(payload):
+    with pytest.raises(BatchValidationError):
+        api.parse_rows(payload)
+
+
+def test_parse_rows_accepts_one_listing_or_many():
+    frame, single = api.parse_rows(LISTING)
+    assert single and list(frame.columns) == api.FEATURES and len(frame) == 1
+    frame, single = api.parse_rows({"rows": [LISTING, LISTING]})
+    assert not single and len(frame) == 2
+
+
+@pytest.fixture
+def server(pipe):
+    batcher = _batcher(pipe)
+    handler = type("Handler", (api.PredictionHandler,), {"batcher": batcher})
+    server = api.PredictionServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    batcher.close()
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"{not json",
+        b"[]",
+        json.dumps({"fuel": "Petrol"}).encode(),
+        json.dumps([LISTING, {**LISTING, "year_built": 1800}]).encode(),
+    ],
+)
+def test_bad_requests_get_a_400(server, pipe, body):
+    resp = requests.post(f"{server}/predict", data=body, timeout=10)
+    assert resp.status_code == 400
+    assert "error" in resp.json()
+    assert pipe.calls == []
@@ -0,0 +1,62 @@
+import pytest
+
+import community
+from fakes import FakeDatabase
+
+
+def _entries(timestamps):
+    return {
+        f"-key{i:03d}": {"uploaded_on": uploaded_on, "user_handle": f"user{i % 3}"}
+        for i, uploaded_on in enumerate(timestamps)
+    }
+
+
+def _newest_first(entries):
+    return sorted(
+        entries, key=lambda key: (entries[key]["uploaded_on"], key), reverse=True
+    )
+
+
+@pytest.fixture(autouse=True)
+def clear_page_cache():
+    community.invalidate()
+    yield
+    community.invalidate()
+
+
+def _read_feed(entries, page_size):
+    ref = FakeDatabase({"car_info": entries}).reference("car_info")
+    feed = community.CommunityFeed(ref, page_size=page_size)
+    while not feed.exhausted:
+        feed.load_more()
+    return [key for key, _ in feed.items]
+
+
+def test_pages_cover_the_feed_in_order():
+    entries = _entries([f"2024-01-{day:02d} 10:00:00" for day in range(1, 24)])
+    assert _read_feed(entries, page_size=5) == _newest_first(entries)
+
+
+def test_many_entries_sharing_a_timestamp_are_neither_skipped_nor_repeated():
+    timestamps = [f"2024-01-{day:02d} 10:00:00" for day in range(1, 19)]
+    timestamps += ["2024-01-10 12:00:00"] * 12
+    entries = _entries(timestamps)
+    assert _read_feed(entries, page_size=5) == _newest_first(entries)
+
+
+def test_every_entry_sharing_one_timestamp():
+    entries = _entries(["2024-01-01 10:00:00"] * 17)
+    assert _read_feed(entries, page_size=4) == _newest_first(entries)
+
+
+def test_last_page_has_no_cursor():
+    ref = FakeDatabase({"car_info": _entries(["2024-01-01", "2024-01-02"])})
+    page, cursor = community.fetch_page(ref.reference("car_info"), page_size=2)
+    assert len(page) == 2
+    assert cursor is None
+
+
+def test_empty_feed():
+    feed = community.CommunityFeed(FakeDatabase().reference("car_info"))
+    assert feed.items == []
+    assert feed.exhausted
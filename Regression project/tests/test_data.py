@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import column_cache
+import data
+
+
+@pytest.fixture
+def cars_csv(tmp_path):
+    path = str(tmp_path / "cars.csv")
+    data.read_cars(data.DATA_PATH).head(200).to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture(params=["cache", "fallback"])
+def source(request, cars_csv, monkeypatch):
+    # Loaded from the memory-mapped column cache, or parsed from the CSV
+    # when the cache cannot be written
+    if request.param == "fallback":
+
+        def fail(*args, **kwargs):
+            raise OSError("read-only file system")
+
+        monkeypatch.setattr(column_cache, "build", fail)
+    return cars_csv
+
+
+def test_column_arrays_are_read_only(source):
+    frame = data.load_cars(source)
+    assert not np.asarray(frame["Price"].array).flags.writeable
+
+
+def test_writes_do_not_reach_the_shared_frame(source):
+    before = data.load_cars(source)
+    price = before.loc[0, "Price"]
+    frame = data.load_cars(source)
+    frame.loc[0, "Price"] = price + 1
+    frame["Brand"] = "Tata"
+    with pytest.raises(ValueError):
+        frame["km_driven"].to_numpy()[0] = 0
+    after = data.load_cars(source)
+    assert after.loc[0, "Price"] == price
+    assert after.equals(before)
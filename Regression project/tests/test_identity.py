@@ -0,0 +1,136 @@
+import logging
+import socket
+import threading
+import time
+
+import pytest
+
+import identity
+from fakes import MockIdentityServer
+from identity import IdentityClient, IdentityError
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(identity, "BACKOFF", 0)
+
+
+@pytest.fixture
+def server():
+    server = MockIdentityServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(server):
+    return IdentityClient("test-key", server.base_url, server.base_url)
+
+
+class DroppingServer:
+    # Reads each request in full, then closes the connection without a
+    # reply: the failure a non-idempotent call must not be resent after
+    def __init__(self):
+        self.requests = 0
+        self._socket = socket.create_server(("127.0.0.1", 0))
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:%d/v1" % self._socket.getsockname()[1]
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                return
+            with conn:
+                data = b""
+                while b"\r\n\r\n" not in data:
+                    data += conn.recv(65536)
+                self.requests += 1
+
+    def close(self):
+        self._socket.close()
+
+
+def _unused_url():
+    with socket.create_server(("127.0.0.1", 0)) as sock:
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def _signup(client, email="a@example.com"):
+    payload = {"email": email, "password": "secret1", "returnSecureToken": True}
+    return client.post("signUp", payload, idempotent=False)
+
+
+def test_idempotent_call_is_retried_on_server_errors(client, server):
+    _signup(client)
+    server.fail_next(2)
+    payload = {"email": "a@example.com", "password": "secret1"}
+    resp = client.post("signInWithPassword", payload)
+    assert resp["registered"]
+    assert server.requests.count("signInWithPassword") == 3
+
+
+def test_signup_is_not_retried_on_server_errors(client, server):
+    server.fail_next(1)
+    resp = _signup(client)
+    assert resp["error"]["code"] == 503
+    assert server.requests == ["signUp"]
+
+
+def test_signup_is_not_resent_after_the_connection_drops():
+    server = DroppingServer()
+    try:
+        client = IdentityClient("test-key", server.base_url, server.base_url)
+        with pytest.raises(IdentityError):
+            _signup(client)
+        assert server.requests == 1
+    finally:
+        server.close()
+
+
+def test_idempotent_call_is_resent_after_the_connection_drops():
+    server = DroppingServer()
+    try:
+        client = IdentityClient("test-key", server.base_url, server.base_url)
+        with pytest.raises(IdentityError):
+            client.post("lookup", {"idToken": "token"})
+        assert server.requests == identity.MAX_RETRIES + 1
+    finally:
+        server.close()
+
+
+def test_signup_is_retried_when_the_connection_is_refused(monkeypatch):
+    attempts = []
+    not_sent = identity._not_sent
+    monkeypatch.setattr(
+        identity, "_not_sent", lambda e: attempts.append(e) or not_sent(e)
+    )
+    client = IdentityClient("test-key", _unused_url(), _unused_url())
+    with pytest.raises(IdentityError):
+        _signup(client)
+    assert len(attempts) == identity.MAX_RETRIES + 1
+
+
+def test_refresh_exchanges_the_refresh_token(client, server):
+    tokens = _signup(client)
+    resp = client.refresh(tokens["refreshToken"])
+    assert resp["user_id"] == tokens["localId"]
+    assert resp["refresh_token"] in server.refresh_tokens
+    assert "error" in client.refresh("not-a-token")
+
+
+def test_background_failures_are_logged(client, server, caplog):
+    server.fail_next(1, status=400)
+    payload = {"requestType": "PASSWORD_RESET", "email": "a@example.com"}
+    with caplog.at_level(logging.WARNING, logger="identity"):
+        client.post_in_background("sendOobCode", payload).result(timeout=10)
+        # The logging callback runs on the worker after the result is set
+        deadline = time.monotonic() + 5
+        while "sendOobCode" not in caplog.text and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert "Background sendOobCode call failed" in caplog.text
@@ -0,0 +1,67 @@
+import pickle
+
+import pytest
+
+import incremental
+import model
+from data import CATEGORY_COLUMNS, DATA_PATH, read_cars
+
+PARAMS = {"n_estimators": 10}
+
+
+@pytest.fixture(scope="module")
+def listings():
+    # Distinct listings from the real dataset: a base set to train on, and
+    # extra ones whose categories the base set has all seen
+    car = read_cars(DATA_PATH).drop_duplicates().sample(frac=1, random_state=0)
+    base, rest = car.iloc[:600], car.iloc[600:]
+    known = rest[CATEGORY_COLUMNS].isin(base[CATEGORY_COLUMNS].to_dict("list"))
+    return base, rest[known.all(axis=1)]
+
+
+@pytest.fixture
+def published(model_dir, tmp_path, listings):
+    # A model trained on the base listings, and the path of its data
+    base, _ = listings
+    (tmp_path / "data").mkdir()
+    data_path = str(tmp_path / "data" / "cars.csv")
+    base.to_csv(data_path, index=False)
+    meta = model.train(PARAMS, data_path, force=True)
+    return data_path, meta
+
+
+def _trees(meta):
+    with open(model.artifact_paths(meta["version"])[0], "rb") as f:
+        return len(pickle.load(f)[-1].estimators_)
+
+
+def test_few_new_rows_wait_for_more(published, listings):
+    data_path, meta = published
+    incremental.append_rows(listings[1].iloc[:10], data_path)
+    report = incremental.update(data_path)
+    assert report["action"] == "waiting" and report["new_rows"] == 10
+    assert model.read_current()["version"] == meta["version"]
+    assert model.covers_data(model.read_current(), data_path)
+
+
+def test_new_rows_are_warm_started(published, listings):
+    data_path, meta = published
+    incremental.append_rows(listings[1].iloc[:100], data_path)
+    report = incremental.update(data_path, drift_threshold=float("inf"))
+    assert report["action"] == "warm_start"
+    current = model.read_current()
+    assert current["incremental"]["base_version"] == meta["version"]
+    assert _trees(current) == _trees(meta) + current["incremental"]["added_trees"]
+    assert model.covers_data(current, data_path)
+    assert incremental.update(data_path)["action"] == "current"
+
+
+def test_drift_triggers_a_full_retrain(published, listings):
+    data_path, meta = published
+    incremental.append_rows(listings[1].iloc[:100], data_path)
+    report = incremental.update(data_path, drift_threshold=float("-inf"))
+    assert report["action"] == "retrain" and "accuracy drift" in report["reason"]
+    current = model.read_current()
+    assert current["version"] != meta["version"] and "incremental" not in current
+    assert _trees(current) == PARAMS["n_estimators"]
+    assert model.covers_data(current, data_path)
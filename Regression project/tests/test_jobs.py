@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+import jobs
+import metrics
+
+
+def _timed_work(seconds):
+    # Runs in a worker process
+    with metrics.timer("test_work_seconds"):
+        jobs.report(0.5, "Half way")
+        time.sleep(seconds)
+    metrics.count("test_work_total", 3)
+    return seconds
+
+
+def _counter(name):
+    counters = metrics.registry.snapshot()["counters"]
+    return sum(c["value"] for c in counters if c["name"] == name)
+
+
+def _timer_count(name):
+    timers = metrics.registry.snapshot()["timers"]
+    return sum(t["count"] for t in timers if t["name"] == name)
+
+
+def _wait(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def runner():
+    runner = jobs.JobRunner(io_workers=2, cpu_workers=1, max_active_per_user=1)
+    yield runner
+    if runner._processes is not None:
+        runner._processes.shutdown()
+
+
+def test_worker_metrics_reach_the_app_registry(runner):
+    job = runner.submit_cpu(_timed_work, 0.01)
+    assert runner.wait(job.id, timeout=60).result == 0.01
+    _wait(lambda: _counter("test_work_total") == 3)
+    assert _timer_count("test_work_seconds") == 1
+
+
+def test_jobs_with_the_same_key_are_shared(runner):
+    first = runner.submit_io(time.sleep, 0.05, key=("sleep",))
+    assert runner.submit_io(time.sleep, 0.05, key=("sleep",)) is first
+    assert runner.wait(first.id, timeout=10).status == jobs.DONE
+
+
+def test_active_jobs_are_limited_per_owner(runner):
+    job = runner.submit_io(time.sleep, 0.2, owner="uid-1")
+    with pytest.raises(jobs.JobLimitError):
+        runner.submit_io(time.sleep, 0.2, owner="uid-1")
+    runner.submit_io(time.sleep, 0.2, owner="uid-2")
+    runner.wait(job.id, timeout=10)
+    # The finished job no longer counts against the owner
+    runner.submit_io(time.sleep, 0, owner="uid-1")
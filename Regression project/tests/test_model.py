@@ -0,0 +1,40 @@
+import json
+import os
+
+import model
+
+
+def _publish(model_dir, version, mtime, surface=True):
+    # The files publish() and price_surface.export() leave for a version
+    names = [f"price_model-{version}.json", f"price_model-{version}.pkl"]
+    names += [f"price_model-{version}.rows.npy"]
+    if surface:
+        names += [f"price_surface-{version}.npy", f"price_surface-{version}.json"]
+    for name in names:
+        (model_dir / name).write_text("{}")
+        os.utime(model_dir / name, (mtime, mtime))
+
+
+def _versions(model_dir):
+    matches = map(model.VERSIONED_FILE.search, os.listdir(model_dir))
+    return {match.group(1) for match in matches if match}
+
+
+def test_prune_keeps_current_and_recent_versions(model_dir):
+    versions = [f"{i:012x}" for i in range(5)]
+    for i, version in enumerate(versions):
+        _publish(model_dir, version, mtime=1_000_000 + i)
+    # The current version is the oldest one, e.g. after pointing back to it
+    (model_dir / "current.json").write_text(json.dumps({"version": versions[0]}))
+    (model_dir / "compact_model-ffffffffffff.npz").write_text("")
+
+    removed = model.prune_artifacts(keep=2)
+
+    assert len(removed) == 2 * 5
+    assert _versions(model_dir) == {versions[0], versions[3], versions[4], "f" * 12}
+
+
+def test_prune_without_previous_versions(model_dir):
+    _publish(model_dir, "0" * 12, mtime=1_000_000, surface=False)
+    (model_dir / "current.json").write_text(json.dumps({"version": "0" * 12}))
+    assert model.prune_artifacts(keep=0) == []
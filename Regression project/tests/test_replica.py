@@ -0,0 +1,183 @@
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import auth
+import community
+import replica as replica_module
+import uploads
+from fakes import FakeBucket, FakeDatabase, MockIdentityServer
+from identity import IdentityClient
+from replica import Replica, WriteBehind
+
+
+def _listing(uploaded_on, user_handle="alice", **extra):
+    return {"uploaded_on": uploaded_on, "user_handle": user_handle, **extra}
+
+
+def _photo():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), "blue").save(buffer, format="JPEG")
+    buffer.seek(0)
+    return buffer
+
+
+def _wait(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def database():
+    return FakeDatabase(
+        {
+            "car_info": {
+                "-a": _listing("2024-01-01", description="first"),
+                "-b": _listing("2024-01-02", "bob"),
+            },
+            "users": {"uid-1": {"handle": "alice"}},
+        }
+    )
+
+
+@pytest.fixture
+def replica(database, tmp_path):
+    writer = WriteBehind(database.reference("/"), flush_interval=0.01, retry_delay=0)
+    replica = Replica(database.reference("/"), str(tmp_path / "r.db"), writer)
+    replica.start()
+    assert replica.wait("car_info", timeout=5) and replica.wait("users", timeout=5)
+    yield replica
+    replica.close()
+
+
+def _keys(replica):
+    page, _ = replica.page(page_size=100)
+    return [key for key, _ in page]
+
+
+def test_initial_snapshot_is_mirrored(replica):
+    assert _keys(replica) == ["-b", "-a"]
+    assert replica.counts() == {"listings": 2, "uploaders": 2, "users": 1}
+    assert replica.handles() == [("alice", 1), ("bob", 1)]
+
+
+def test_remote_put_patch_and_delete_are_applied(database, replica):
+    database.reference("car_info/-c").set(_listing("2024-01-03"))
+    _wait(lambda: "-c" in _keys(replica))
+
+    database.reference("car_info/-a").update({"description": "edited"})
+    _wait(lambda: dict(replica.page(page_size=100)[0])["-a"]["description"] == "edited")
+    assert dict(replica.page(page_size=100)[0])["-a"]["uploaded_on"] == "2024-01-01"
+
+    database.reference("car_info/-b").delete()
+    _wait(lambda: "-b" not in _keys(replica))
+    assert _keys(replica) == ["-c", "-a"]
+
+
+def test_replacing_the_node_replaces_the_table(database, replica):
+    database.reference("car_info").set({"-z": _listing("2025-01-01")})
+    _wait(lambda: _keys(replica) == ["-z"])
+
+
+def test_local_writes_are_visible_at_once_and_sent_in_batches(database, replica):
+    writes = database.writes
+    keys = [replica.push("car_info", _listing("2024-02-01")) for _ in range(3)]
+    assert set(keys) <= set(_keys(replica))
+    replica.writer.flush()
+    assert set(keys) <= set(database.reference("car_info").get())
+    assert database.writes - writes == 1
+
+
+def test_failed_batches_are_retried(database, replica):
+    database.fail_writes = 2
+    replica.set("users/uid-2", {"handle": "carol"})
+    replica.writer.flush()
+    assert database.reference("users/uid-2").get() == {"handle": "carol"}
+    assert replica.writer.failed == 0
+
+
+def test_paging_matches_the_firebase_feed(tmp_path):
+    timestamps = [f"2024-01-{day:02d}" for day in range(1, 15)] + ["2024-01-07"] * 9
+    entries = {f"-k{i:02d}": _listing(ts) for i, ts in enumerate(timestamps)}
+    database = FakeDatabase({"car_info": entries})
+    replica = Replica(database.reference("/"), str(tmp_path / "r.db")).start()
+    try:
+        replica.wait("car_info", timeout=5)
+        for page_size in (1, 4, 10):
+            community.invalidate()
+            ref = database.reference("car_info")
+            from_firebase = community.CommunityFeed(ref, page_size)
+            from_replica = community.CommunityFeed(ref, page_size, replica=replica)
+            while not (from_firebase.exhausted and from_replica.exhausted):
+                from_firebase.load_more()
+                from_replica.load_more()
+            assert from_replica.items == from_firebase.items
+            assert len(from_replica.items) == len(entries)
+    finally:
+        replica.close()
+
+
+def test_feed_can_be_filtered_by_uploader(replica):
+    page, cursor = replica.page(page_size=10, user_handle="bob")
+    assert [key for key, _ in page] == ["-b"]
+    assert cursor is None
+
+
+class _GatedRoot:
+    # Root reference whose updates wait for the test to open the gate
+    def __init__(self, ref):
+        self._ref = ref
+        self.gate = threading.Event()
+
+    def update(self, batch):
+        self.gate.wait(timeout=5)
+        self._ref.update(batch)
+
+
+@pytest.fixture
+def gated_writer(database, monkeypatch):
+    root = _GatedRoot(database.reference("/"))
+    writer = WriteBehind(root, flush_interval=0.01, retry_delay=0)
+    monkeypatch.setitem(replica_module._shared, "writer", writer)
+    writer.gate = root.gate
+    yield writer
+    writer.gate.set()
+    writer.close()
+
+
+def test_signup_returns_before_the_profile_is_written(
+    database, gated_writer, monkeypatch
+):
+    server = MockIdentityServer().start()
+    try:
+        monkeypatch.setattr(
+            auth, "client", IdentityClient("key", server.base_url, server.base_url)
+        )
+        monkeypatch.setattr(auth, "send_verification_email", lambda id_token: None)
+        assert auth.signup_user("c@example.com", "secret1", "carol") == {
+            "success": True
+        }
+        uid = server.accounts["c@example.com"]["localId"]
+    finally:
+        server.stop()
+    assert database.writes == 0
+    assert database.reference(f"users/{uid}").get() is None
+    gated_writer.gate.set()
+    gated_writer.flush()
+    assert database.reference(f"users/{uid}").get()["handle"] == "carol"
+
+
+def test_upload_returns_before_the_listing_is_written(database, gated_writer):
+    key = uploads.upload_car_info(
+        FakeBucket(), replica_module.get_writer(), _photo(), "Blue sedan", "alice"
+    )
+    assert database.writes == 0
+    assert key not in database.reference("car_info").get()
+    gated_writer.gate.set()
+    gated_writer.flush()
+    assert database.reference(f"car_info/{key}").get()["description"] == "Blue sedan"
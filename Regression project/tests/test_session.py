@@ -0,0 +1,149 @@
+from types import SimpleNamespace
+
+import pytest
+
+import identity
+import session
+from fakes import MockIdentityServer
+from identity import IdentityClient
+
+
+@pytest.fixture
+def server():
+    server = MockIdentityServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = session.SessionStore(str(tmp_path / "sessions.db"))
+    monkeypatch.setitem(session._shared, "store", store)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def browser(monkeypatch, server, store):
+    # Stands in for st: session state plus the request's cookies
+    fake_st = SimpleNamespace(session_state={}, context=SimpleNamespace(cookies={}))
+    monkeypatch.setattr(session, "st", fake_st)
+    monkeypatch.setattr(
+        session, "client", IdentityClient("test-key", server.base_url, server.base_url)
+    )
+    session._verified.clear()
+    return fake_st
+
+
+def _login(server):
+    client = IdentityClient("test-key", server.base_url, server.base_url)
+    payload = {"email": "a@example.com", "password": "secret1", "displayName": "A"}
+    tokens = client.post("signUp", {**payload, "returnSecureToken": True})
+    server.verify_email(payload["email"])
+    return {
+        "uid": tokens["localId"],
+        "handle": "A",
+        "idToken": tokens["idToken"],
+        "refreshToken": tokens["refreshToken"],
+        "expiresIn": tokens["expiresIn"],
+    }
+
+
+def _reload(browser):
+    # A new browser tab: fresh session state, the cookie written last time
+    browser.context.cookies = {session.COOKIE_NAME: browser.session_state["cookie"]}
+    browser.session_state = {}
+    session._verified.clear()
+
+
+def test_store_keeps_only_a_hash_of_the_session_id(store):
+    session_id = store.create("uid-1", "A", "refresh-1")
+    assert store.get(session_id) == {
+        "uid": "uid-1",
+        "handle": "A",
+        "refresh_token": "refresh-1",
+    }
+    (stored_id,) = store._conn.execute("SELECT id_hash FROM sessions").fetchone()
+    assert stored_id != session_id
+    store.delete(session_id)
+    assert store.get(session_id) is None
+
+
+def test_expired_sessions_are_not_returned(store):
+    session_id = store.create("uid-1", "A", "refresh-1", max_age=-1)
+    assert store.get(session_id) is None
+    assert store.get(None) is None
+
+
+def test_cookie_carries_only_the_session_id(browser, server):
+    login = _login(server)
+    session.start_session(login)
+    cookie = browser.session_state["pending_cookie"]
+    assert login["refreshToken"] not in cookie
+    assert session.get_store().get(cookie)["uid"] == login["uid"]
+
+
+def test_reload_restores_the_session_and_rotates_the_token(browser, server):
+    login = _login(server)
+    session.start_session(login)
+    browser.session_state["cookie"] = browser.session_state["pending_cookie"]
+    _reload(browser)
+    assert session.restore_session()
+    assert session.current_uid() == login["uid"]
+    cookie = browser.context.cookies[session.COOKIE_NAME]
+    assert session.get_store().get(cookie)["refresh_token"] != login["refreshToken"]
+
+
+def test_logout_ends_only_this_session(browser, server):
+    login = _login(server)
+    session.start_session(login)
+    cookie = browser.session_state["cookie"] = browser.session_state["pending_cookie"]
+    other = session.get_store().create(login["uid"], "A", login["refreshToken"])
+    session.end_session()
+    assert browser.session_state["pending_cookie"] == ""
+    # The user's other devices stay signed in
+    assert session.get_store().get(other)["uid"] == login["uid"]
+    assert session.get_store().get(cookie) is None
+    _reload(browser)
+    assert not session.restore_session()
+
+
+def test_invalid_refresh_token_ends_the_session(browser, server):
+    login = _login(server)
+    session.start_session(login)
+    browser.session_state["cookie"] = browser.session_state["pending_cookie"]
+    server.refresh_tokens.clear()
+    _reload(browser)
+    assert not session.restore_session()
+    assert not browser.session_state["logged_in"]
+    assert session.get_store().get(browser.context.cookies[session.COOKIE_NAME]) is None
+
+
+def test_transient_refresh_failure_keeps_the_session(browser, server, monkeypatch):
+    monkeypatch.setattr(identity, "BACKOFF", 0)
+    login = _login(server)
+    session.start_session(login)
+    browser.session_state["cookie"] = browser.session_state["pending_cookie"]
+    server.fail_next(identity.MAX_RETRIES + 1, status=503)
+    _reload(browser)
+    assert not session.restore_session()
+    assert "pending_cookie" not in browser.session_state
+    cookie = browser.context.cookies[session.COOKIE_NAME]
+    assert session.get_store().get(cookie)["uid"] == login["uid"]
+    # The next run, once the service answers again, logs the user back in
+    browser.session_state = {}
+    assert session.restore_session()
+    assert session.current_uid() == login["uid"]
+
+
+@pytest.mark.parametrize("message", ["TOKEN_EXPIRED", "USER_DISABLED"])
+def test_rejected_refresh_token_ends_the_session(browser, server, monkeypatch, message):
+    login = _login(server)
+    session.start_session(login)
+    browser.session_state["cookie"] = browser.session_state["pending_cookie"]
+    monkeypatch.setattr(
+        session.client, "refresh", lambda token: {"error": {"message": message}}
+    )
+    _reload(browser)
+    assert not session.restore_session()
+    assert session.get_store().get(browser.context.cookies[session.COOKIE_NAME]) is None
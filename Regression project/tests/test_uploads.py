@@ -0,0 +1,69 @@
+import io
+
+import pytest
+from PIL import Image
+
+import jobs
+import uploads
+from fakes import FakeBucket, FakeDatabase
+from replica import Replica
+
+
+def _photo(color="red", size=(640, 480)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="JPEG")
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.fixture
+def replica(tmp_path):
+    replica = Replica(FakeDatabase().reference("/"), path=str(tmp_path / "r.db"))
+    yield replica.start()
+    replica.close()
+
+
+def test_known_photo_is_not_uploaded_again():
+    bucket = FakeBucket()
+    first = uploads.store_image(bucket, _photo())
+    uploaded = bucket.bytes_uploaded
+    second = uploads.store_image(bucket, _photo())
+    assert second == first
+    assert bucket.bytes_uploaded == uploaded
+    assert len(bucket.objects) == 2
+
+
+def test_blob_names_follow_the_content():
+    bucket = FakeBucket()
+    red = uploads.store_image(bucket, _photo("red"))
+    blue = uploads.store_image(bucket, _photo("blue"))
+    digest = uploads.content_hash(_photo("red"))
+    assert red != blue
+    assert red[0].endswith(uploads.blob_names(digest)[0])
+    assert len(bucket.objects) == 4
+
+
+def test_images_are_resized():
+    bucket = FakeBucket()
+    main_url, thumb_url = uploads.store_image(bucket, _photo(size=(4000, 3000)))
+    with Image.open(io.BytesIO(bucket.objects[main_url.split("/", 4)[-1]])) as main:
+        assert max(main.size) <= max(uploads.MAX_IMAGE_SIZE)
+    with Image.open(io.BytesIO(bucket.objects[thumb_url.split("/", 4)[-1]])) as thumb:
+        assert max(thumb.size) <= max(uploads.THUMBNAIL_SIZE)
+
+
+def test_resubmitting_an_upload_reuses_the_job(monkeypatch, replica):
+    hashed = []
+    content_hash = uploads.content_hash
+    monkeypatch.setattr(
+        uploads, "content_hash", lambda f: hashed.append(1) or content_hash(f)
+    )
+    bucket = FakeBucket()
+    args = (bucket, replica, _photo("green"), "Green hatchback", "alice")
+    job = uploads.submit_upload(*args, owner="uid-dedup")
+    assert uploads.submit_upload(*args, owner="uid-dedup") is job
+    assert jobs.wait(job.id, timeout=10).status == jobs.DONE
+    # Hashed once per submission: the job reuses the key's digest
+    assert len(hashed) == 2
+    page, _ = replica.page()
+    assert [entry["description"] for _, entry in page] == ["Green hatchback"]
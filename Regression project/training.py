@@ -0,0 +1,235 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from scipy.sparse import csr_matrix, hstack
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import r2_score
+from sklearn.model_selection import KFold, train_test_split
+from sklearn.preprocessing import OneHotEncoder
+
+from data import DATA_PATH, data_fingerprint
+from model import (
+    CATEGORICAL_FEATURES,
+    DEFAULT_PARAMS,
+    MODEL_DIR,
+    load_training_data,
+    resolve_params,
+    train,
+)
+
+# Replaces the notebook's serial random_state sweep with a cross-validated
+# search over the hyperparameters that actually change the model
+SEARCH_SPACE = {
+    "n_estimators": [100, 200, 400],
+    "max_depth": [None, 20, 40],
+    "min_samples_leaf": [1, 2, 4],
+    "max_features": [1.0, 0.5, "sqrt"],
+}
+CV_FOLDS = 5
+
+_folds = None
+
+
+def candidates(space=SEARCH_SPACE, n_iter=None, seed=DEFAULT_PARAMS["random_state"]):
+    # Full grid, or a reproducible random sample of it
+    keys = sorted(space)
+    grid = [
+        dict(zip(keys, values))
+        for values in itertools.product(*(space[key] for key in keys))
+    ]
+    if n_iter is not None and n_iter < len(grid):
+        grid = random.Random(seed).sample(grid, n_iter)
+    return grid
+
+
+def params_key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+def encode_folds(X, y, cv_folds=CV_FOLDS, seed=DEFAULT_PARAMS["random_state"]):
+    # The one-hot transform depends only on the fold, not on the forest, so
+    # it is fitted once per fold and shared by every candidate
+    folds = []
+    splitter = KFold(n_splits=cv_folds, shuffle=True, random_state=seed)
+    for train_idx, val_idx in splitter.split(X):
+        X_train, X_val = X.iloc[train_idx], X.iloc[val_idx]
+        encoder = OneHotEncoder(handle_unknown="ignore").fit(
+            X_train[CATEGORICAL_FEATURES]
+        )
+        folds.append(
+            (
+                _encode(encoder, X_train),
+                y.iloc[train_idx].to_numpy(),
+                _encode(encoder, X_val),
+                y.iloc[val_idx].to_numpy(),
+            )
+        )
+    return folds
+
+
+def _encode(encoder, frame):
+    # Same column layout as the pipeline's column transformer: one-hot
+    # columns first, the numeric columns passed through after them
+    numeric = [column for column in frame.columns if column not in CATEGORICAL_FEATURES]
+    return hstack(
+        [
+            encoder.transform(frame[CATEGORICAL_FEATURES]),
+            csr_matrix(frame[numeric].to_numpy(dtype="float64")),
+        ],
+        format="csr",
+    )
+
+
+def _init_worker(folds):
+    # Each worker receives the encoded folds once instead of per task
+    global _folds
+    _folds = folds
+
+
+def _score(params, fold):
+    X_train, y_train, X_val, y_val = _folds[fold]
+    start = time.perf_counter()
+    rf = RandomForestRegressor(
+        n_estimators=params["n_estimators"],
+        max_depth=params["max_depth"],
+        min_samples_leaf=params["min_samples_leaf"],
+        max_features=params["max_features"],
+        random_state=params["random_state"],
+        n_jobs=1,
+    )
+    rf.fit(X_train, y_train)
+    return {
+        "params": params,
+        "fold": fold,
+        "r2": float(r2_score(y_val, rf.predict(X_val))),
+        "fit_seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def checkpoint_path(fingerprint, grid, cv_folds):
+    # One results file per (dataset, candidate list, fold count), so a rerun
+    # of the same search picks up where the last one stopped
+    digest = hashlib.sha256(
+        json.dumps([fingerprint, [params_key(p) for p in grid], cv_folds]).encode()
+    ).hexdigest()[:12]
+    return os.path.join(MODEL_DIR, f"search-{digest}.jsonl")
+
+
+def read_checkpoint(path):
+    done = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # A line cut short by an interrupted write
+                    continue
+                done[(params_key(result["params"]), result["fold"])] = result
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def summarize(results):
+    by_params = {}
+    for result in results:
+        by_params.setdefault(params_key(result["params"]), []).append(result["r2"])
+    summary = [
+        {"params": json.loads(key), "cv_r2": sum(scores) / len(scores)}
+        for key, scores in by_params.items()
+    ]
+    return sorted(summary, key=lambda row: row["cv_r2"], reverse=True)
+
+
+def search(
+    space=SEARCH_SPACE,
+    n_iter=None,
+    cv_folds=CV_FOLDS,
+    workers=None,
+    data_path=DATA_PATH,
+    on_result=None,
+):
+    # Cross-validates every candidate on the training split (the holdout
+    # used by model.train stays unseen) and returns candidates best-first
+    defaults = resolve_params()
+    grid = [resolve_params(params) for params in candidates(space, n_iter)]
+    fingerprint = data_fingerprint(data_path)
+    path = checkpoint_path(fingerprint, grid, cv_folds)
+    done = read_checkpoint(path)
+    pending = [
+        (params, fold)
+        for params in grid
+        for fold in range(cv_folds)
+        if (params_key(params), fold) not in done
+    ]
+
+    if pending:
+        X, y = load_training_data(data_path)
+        X_train, _, y_train, _ = train_test_split(
+            X,
+            y,
+            test_size=defaults["test_size"],
+            random_state=defaults["random_state"],
+        )
+        folds = encode_folds(X_train, y_train, cv_folds)
+        os.makedirs(MODEL_DIR, exist_ok=True)
+        with open(path, "a") as checkpoint, ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            initializer=_init_worker,
+            initargs=(folds,),
+        ) as pool:
+            futures = [pool.submit(_score, params, fold) for params, fold in pending]
+            for future in as_completed(futures):
+                result = future.result()
+                checkpoint.write(json.dumps(result) + "\n")
+                checkpoint.flush()
+                done[(params_key(result["params"]), result["fold"])] = result
+                if on_result:
+                    on_result(result, len(done), len(grid) * cv_folds)
+
+    return summarize(done.values()), path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cross-validated hyperparameter search for the price model"
+    )
+    parser.add_argument("--n-iter", type=int, help="random sample of the grid")
+    parser.add_argument("--folds", type=int, default=CV_FOLDS)
+    parser.add_argument("--workers", type=int, help="defaults to all cores")
+    parser.add_argument(
+        "--no-publish", action="store_true", help="only report the ranking"
+    )
+    args = parser.parse_args()
+
+    def progress(result, completed, total):
+        print(
+            f"[{completed}/{total}] fold {result['fold']} "
+            f"r2={result['r2']:.4f} {params_key(result['params'])}",
+            flush=True,
+        )
+
+    ranking, path = search(
+        n_iter=args.n_iter,
+        cv_folds=args.folds,
+        workers=args.workers,
+        on_result=progress,
+    )
+    print(f"Results checkpointed in {path}")
+    for row in ranking[:5]:
+        print(f"cv_r2={row['cv_r2']:.4f} {params_key(row['params'])}")
+
+    if not args.no_publish:
+        meta = train(ranking[0]["params"])
+        print(json.dumps(meta, indent=2))
+
+
+if __name__ == "__main__":
+    main()
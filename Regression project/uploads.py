@@ -0,0 +1,122 @@
+import hashlib
+import io
+from datetime import datetime
+
+from PIL import Image, ImageOps, features
+
+import jobs
+import metrics
+
+MAX_IMAGE_SIZE = (1600, 1600)
+THUMBNAIL_SIZE = (400, 400)
+IMAGE_QUALITY = 80
+THUMBNAIL_QUALITY = 70
+HASH_CHUNK_SIZE = 1 << 16
+# Blob names are content hashes, so an object never changes once written
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+if features.check("webp"):
+    IMAGE_FORMAT, IMAGE_EXTENSION, CONTENT_TYPE = "WEBP", "webp", "image/webp"
+else:
+    IMAGE_FORMAT, IMAGE_EXTENSION, CONTENT_TYPE = "JPEG", "jpg", "image/jpeg"
+
+
+def _encode(image, quality):
+    buffer = io.BytesIO()
+    # Saving without exif/icc arguments drops the camera metadata
+    image.save(buffer, format=IMAGE_FORMAT, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def content_hash(file_obj):
+    # Streams the file through sha256 and rewinds it for decoding
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def blob_names(digest):
+    return (
+        f"car_info/{digest}.{IMAGE_EXTENSION}",
+        f"car_info/thumbs/{digest}.{IMAGE_EXTENSION}",
+    )
+
+
+@metrics.timed("image_process_seconds")
+def process_image(file_obj):
+    # Decodes once and returns (main image bytes, thumbnail bytes)
+    with Image.open(file_obj) as source:
+        source.draft("RGB", MAX_IMAGE_SIZE)
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        if IMAGE_FORMAT == "JPEG" and image.mode == "RGBA":
+            image = image.convert("RGB")
+
+    image.thumbnail(MAX_IMAGE_SIZE, Image.Resampling.LANCZOS)
+    main = _encode(image, IMAGE_QUALITY)
+    image.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+    thumbnail = _encode(image, THUMBNAIL_QUALITY)
+    return main, thumbnail
+
+
+def _upload_blob(blob, data):
+    blob.cache_control = CACHE_CONTROL
+    with metrics.timer("storage_upload_seconds"):
+        blob.upload_from_string(data, content_type=CONTENT_TYPE)
+        blob.make_public()
+    metrics.count("storage_upload_bytes_total", len(data))
+
+
+def store_image(bucket, file_obj, digest=None):
+    # Returns (image_url, thumb_url); a photo that is already stored is
+    # neither re-processed nor re-sent. Pass the content_hash() if the
+    # caller already has it, so the file is not read an extra time.
+    main_name, thumb_name = blob_names(digest or content_hash(file_obj))
+    main_blob, thumb_blob = bucket.blob(main_name), bucket.blob(thumb_name)
+    if not (main_blob.exists() and thumb_blob.exists()):
+        jobs.report(0.2, "Processing image...")
+        main, thumbnail = process_image(file_obj)
+        jobs.report(0.4, "Uploading image...")
+        _upload_blob(main_blob, main)
+        jobs.report(0.7, "Uploading thumbnail...")
+        _upload_blob(thumb_blob, thumbnail)
+    return main_blob.public_url, thumb_blob.public_url
+
+
+def upload_car_info(bucket, writer, file_obj, description, user_handle, digest=None):
+    # writer is the running replica.Replica, whose local feed shows the
+    # listing at once, or else the shared replica.WriteBehind
+    image_url, thumb_url = store_image(bucket, file_obj, digest)
+    jobs.report(0.9, "Saving listing...")
+    listing = {
+        "image_url": image_url,
+        "thumb_url": thumb_url,
+        "description": description,
+        "user_handle": user_handle,
+        "uploaded_on": datetime.now().isoformat(),
+    }
+    # Reaches Firebase write-behind
+    return writer.push("car_info", listing)
+
+
+def submit_upload(bucket, writer, file_obj, description, user_handle, owner):
+    # Image processing and the Storage round trips run as an I/O job instead
+    # of on the Streamlit script thread. Resubmitting the same photo and
+    # description returns the job already under way.
+    digest = content_hash(file_obj)
+    return jobs.submit_io(
+        upload_car_info,
+        bucket,
+        writer,
+        file_obj,
+        description,
+        user_handle,
+        digest,
+        owner=owner,
+        key=("upload", owner, digest, description),
+        label="Upload car info",
+    )
@@ -1,132 +1,206 @@
-import streamlit as st
-import pandas as pd
-import plotly.express as px
-import firebase_admin
-from datetime import datetime
+import importlib
 import os
-from firebase_admin import credentials, db, storage
-from dotenv import load_dotenv
-from sklearn.model_selection import train_test_split
-from sklearn.pipeline import make_pipeline
-from sklearn.metrics import r2_score
-from sklearn.preprocessing import OneHotEncoder
-from sklearn.compose import make_column_transformer
-from sklearn.ensemble import RandomForestRegressor
-from PIL import Image
-import numpy as np
-
-
-load_dotenv()
-DATABASE_URL = os.getenv("database_url")
-STORAGE_BUCKET = os.getenv("storage")
-cred = credentials.Certificate("json_key.json")
-if not firebase_admin._apps:
-    firebase_admin.initialize_app(
-        cred, {"databaseURL": DATABASE_URL, "storageBucket": STORAGE_BUCKET}
-    )
+import tempfile
+
+import streamlit as st
+
+import community
+import jobs
+import metrics
+import replica
+import session
+from formatting import format_indian_number
+
+# pandas, plotly, PIL, scikit-learn and firebase_admin are imported by the
+# pages that use them, so Home and About render without them. After login
+# warm_up() loads them, and the dataset and model, in the background; set
+# warmup=off to skip that (e.g. when profiling imports per page).
+WARMUP = os.getenv("warmup", "on").lower() not in ("0", "off", "false", "no")
 
 
 website_name = "PriceMyRide"
 icon_url = "https://t3.ftcdn.net/jpg/01/71/13/24/360_F_171132449_uK0OO5XHrjjaqx5JUbJOIoCC3GZP84Mt.jpg"
 
-st.markdown(
-    f"""
+
+def render_header():
+    st.markdown(
+        f"""
     <div class="title-icon-container">
         <img class="icon" src="{icon_url}" alt="Car Icon">
         <div class="title">{website_name}</div>
     </div>
     """,
-    unsafe_allow_html=True,
-)
+        unsafe_allow_html=True,
+    )
+
+
+def job_owner():
+    return session.current_uid() or st.session_state.get("handle", "Anonymous User")
+
+
+def finished_job(state_key):
+    # Pops and returns the job whose ID is kept under state_key once it has
+    # finished; None while it is still running or when there is none
+    job = jobs.get(st.session_state.get(state_key))
+    if job is None:
+        st.session_state.pop(state_key, None)
+        return None
+    if not job.finished:
+        return None
+    del st.session_state[state_key]
+    return job
+
+
+@st.fragment(run_every=1)
+def job_progress(state_key, cancellable=True):
+    # Polls a background job without blocking the rest of the page and
+    # reruns the page once it has finished
+    job = jobs.get(st.session_state.get(state_key))
+    if job is None or job.finished:
+        st.rerun()
+    st.progress(job.progress, text=job.message or f"{job.label}...")
+    if cancellable and st.button(
+        "Cancel", key=f"{state_key}_cancel", disabled=job.cancel_requested
+    ):
+        jobs.cancel(job.id)
 
 
 def upload_car_info():
+    job = finished_job("upload_job")
+    if job is not None:
+        if job.status == jobs.DONE:
+            community.invalidate()
+            st.session_state.pop("community_feed", None)
+            st.session_state["upload_message"] = (
+                "success",
+                "Car information uploaded successfully!",
+            )
+        elif job.status == jobs.CANCELLED:
+            st.session_state["upload_message"] = ("info", "Upload cancelled.")
+        else:
+            st.session_state["upload_message"] = (
+                "error",
+                f"Upload failed: {job.error}",
+            )
+
     car_image = st.file_uploader("Upload Car Image", type=["jpg", "jpeg", "png"])
-    image = None
     if car_image is not None:
-        image = Image.open(car_image)
-        st.image(image, caption="Uploaded Image", use_container_width=True)
+        st.image(car_image, caption="Uploaded Image", use_container_width=True)
 
     description = st.text_area("Enter a short description about your car")
     user_handle = st.session_state.get("handle", "Anonymous User")
 
     if st.button("Upload"):
-        if car_image is not None and description:
+        if "upload_job" in st.session_state:
+            st.warning("Your previous upload is still being processed.")
+        elif car_image is not None and description:
+            import uploads
+            from firebase_admin import storage
+
+            from firebase_setup import STORAGE_BUCKET
+
             try:
-                bucket = storage.bucket(STORAGE_BUCKET)
-                car_image.seek(0)
-                image_file_name = f"car_info/{car_image.name}"
-                blob = bucket.blob(image_file_name)
-                blob.upload_from_file(car_image)
-                blob.make_public()
-
-                car_info_ref = db.reference("car_info")
-                car_info_ref.push(
-                    {
-                        "image_url": blob.public_url,
-                        "description": description,
-                        "user_handle": user_handle,
-                        "uploaded_on": datetime.now().isoformat(),
-                    }
-                )
-                st.success("Car information uploaded successfully!")
-            except Exception as e:
-                st.error(f"Upload failed: {e}")
+                st.session_state["upload_job"] = uploads.submit_upload(
+                    storage.bucket(STORAGE_BUCKET),
+                    replica.running_replica() or replica.get_writer(),
+                    car_image,
+                    description,
+                    user_handle,
+                    owner=job_owner(),
+                ).id
+            except jobs.JobLimitError as e:
+                st.warning(str(e))
         else:
             st.warning("Please upload an image and enter a description.")
 
+    message = st.session_state.pop("upload_message", None)
+    if message:
+        level, text = message
+        getattr(st, level)(text)
+    if "upload_job" in st.session_state:
+        job_progress("upload_job")
+
 
 def show_community_page():
     st.markdown("### Community Showcase")
     st.write("See what fellow car enthusiasts are sharing!")
 
     try:
-        car_info_ref = db.reference("car_info")
-        car_data = car_info_ref.get()
-
-        if car_data:
-            car_data_sorted = sorted(
-                car_data.items(),
-                key=lambda x: x[1].get("uploaded_on", ""),
-                reverse=True,
+        mirror = replica.get_replica()
+        user_handle = None
+        if mirror.ready():
+            counts = mirror.counts()
+            st.caption(
+                f"{counts['listings']} listings from {counts['uploaders']} members"
             )
-
-            for _, car_info in car_data_sorted:
+            uploaders = {
+                f"{handle} ({listings})": handle
+                for handle, listings in mirror.handles()
+            }
+            shown = st.selectbox("Show uploads from", ["Everyone", *uploaders])
+            user_handle = uploaders.get(shown)
+
+        refresh = st.button("Refresh")
+        feed = st.session_state.get("community_feed")
+        stale = feed is None or refresh or feed.user_handle != user_handle
+        if stale and mirror.ready():
+            # Served from the local replica: a few SQLite index lookups
+            feed = community.CommunityFeed(
+                None, replica=mirror, user_handle=user_handle
+            )
+            st.session_state["community_feed"] = feed
+        elif stale and "community_feed_job" not in st.session_state:
+            # Until the replica has synced once, the first page is fetched
+            # from Firebase as an I/O job; the previous feed, if any, stays
+            # on screen until it arrives
+            from firebase_admin import db
+
+            st.session_state["community_feed_job"] = jobs.submit_io(
+                community.CommunityFeed,
+                db.reference("car_info"),
+                owner=job_owner(),
+                label="Loading community uploads",
+            ).id
+        job = finished_job("community_feed_job")
+        if job is not None and job.status == jobs.FAILED:
+            raise job.error
+        if job is not None and job.status == jobs.DONE:
+            feed = st.session_state["community_feed"] = job.result
+        if "community_feed_job" in st.session_state:
+            job_progress("community_feed_job", cancellable=False)
+            if feed is None:
+                return
+
+        if feed.items:
+            for _, car_info in feed.items:
                 image_url = car_info.get("image_url")
                 description = car_info.get("description", "No description provided.")
                 handle = car_info.get("user_handle")
                 uploaded_at = car_info.get("uploaded_on", "Unknown date")
 
-                if image_url:
+                thumb_url = car_info.get("thumb_url")
+
+                if thumb_url:
+                    st.subheader(f"{handle} uploaded:")
+                    st.image(thumb_url, caption=description)
+                    st.caption(
+                        f"Uploaded on: {uploaded_at} · [View full size]({image_url})"
+                    )
+                elif image_url:
                     st.subheader(f"{handle} uploaded:")
                     st.image(image_url, caption=description, use_container_width=True)
                     st.caption(f"Uploaded on: {uploaded_at}")
                 st.markdown("---")
+            if not feed.exhausted and st.button("Load more"):
+                feed.load_more()
+                st.rerun()
         else:
             st.info("No uploads yet! Be the first to share your car.")
     except Exception as e:
         st.error(f"Error loading community data: {e}")
 
 
-car = pd.read_csv("Clean_car.csv")
-car = car.loc[:, ~car.columns.str.contains("^Unnamed")]
-X = car.drop(columns="Price")
-y = car["Price"]
-
-
-def format_indian_number(number):
-    if number >= 10000000:
-        return f"{number / 10000000:.2f} Cr"
-    elif number >= 100000:
-        return f"{number / 100000:.2f} Lakh"
-    elif number >= 1000:
-        return f"{number / 1000:.2f} Thousand"
-    else:
-        return f"{number:.2f}"
-
-
-st.markdown(
-    """
+PAGE_STYLE = """
     <style>
     @import url('https://fonts.googleapis.com/css2?family=Josefin+Sans:wght@300;700&family=Lora:wght@400;700&display=swap');
 
@@ -210,18 +284,14 @@ st.markdown(
         font-family: 'Josefin Sans', sans-serif;
     }
     </style>
-    """,
-    unsafe_allow_html=True,
-)
+    """
 
 
-st.sidebar.subheader(f"Welcome {st.session_state.get('handle', 'User')}!")
-page = st.sidebar.selectbox(
-    "Navigate to:", ["Home", "Predictions", "Explore Models", "Community", "About"]
-)
+def inject_style():
+    st.markdown(PAGE_STYLE, unsafe_allow_html=True)
 
 
-if page == "Home":
+def home_page():
     st.markdown("## Welcome to PriceMyRide!")
     st.write(
         """
@@ -255,117 +325,124 @@ if page == "Home":
         upload_car_info()
 
 
-elif page == "Predictions":
+def predictions_page():
+    import model
+    from data import data_fingerprint
+    from options import get_option_index
+    from price_surface import predict_one
+
     st.header("Car Price Prediction")
+    # Training on new data runs as a CPU job shared by every session
+    job = finished_job("train_job")
+    if job is not None and job.status == jobs.FAILED:
+        st.error(f"Training the price model failed: {job.error}")
+        return
+    if "train_job" not in st.session_state and not model.model_ready():
+        st.session_state["train_job"] = jobs.submit_cpu(
+            model.ensure_model,
+            key=("train", data_fingerprint()),
+            label="Training the price model",
+        ).id
+    if "train_job" in st.session_state:
+        st.info("The price model is being trained on the latest data.")
+        job_progress("train_job", cancellable=False)
+        return
+
+    options = get_option_index()
     st.write(
         "Fill in your car details below and let our model estimate its current value!"
     )
 
     col1, col2 = st.columns(2)
     with col1:
-        selected_brand = st.selectbox("Select Brand", car["Brand"].unique())
-        model_df = car[car["Brand"] == selected_brand]
-        selected_model = st.selectbox("Select Model", model_df["Model"].unique())
+        selected_brand = st.selectbox("Select Brand", options.brands)
+        selected_model = st.selectbox("Select Model", options.models(selected_brand))
     with col2:
         year_built = st.number_input(
             "Year Built", min_value=2000, max_value=2024, value=2015
         )
-        selected_fuel = st.selectbox("Fuel Type", model_df["fuel"].unique())
+        selected_fuel = st.selectbox(
+            "Fuel Type", options.fuels(selected_brand, selected_model)
+        )
 
     col3, col4 = st.columns(2)
     with col3:
         distance_driven = st.number_input("Distance Driven (km)", min_value=0, step=500)
     with col4:
-        seller_type = st.selectbox("Seller Type", car["seller_type"].unique())
+        seller_type = st.selectbox("Seller Type", options.seller_types)
 
     col5, col6 = st.columns(2)
     with col5:
-        transmission = st.selectbox("Transmission", model_df["transmission"].unique())
+        transmission = st.selectbox(
+            "Transmission", options.transmissions(selected_brand, selected_model)
+        )
     with col6:
         prev_owners = st.selectbox("Previous Owners", ["Zero", "One", "Two"])
 
-    input_data = pd.DataFrame(
-        [
-            [
-                selected_fuel,
-                seller_type,
-                transmission,
-                prev_owners,
-                selected_brand,
-                selected_model,
-                year_built,
-                distance_driven,
-            ]
-        ],
-        columns=[
-            "fuel",
-            "seller_type",
-            "transmission",
-            "previous_owners",
-            "Brand",
-            "Model",
-            "year_built",
-            "km_driven",
-        ],
+    range_width = st.select_slider(
+        "Price range covers the middle", options=["50%", "80%", "90%"], value="80%"
+    )
+
+    # In FEATURES order; a single tuple goes through the surface's fast path
+    input_row = (
+        selected_fuel,
+        seller_type,
+        transmission,
+        prev_owners,
+        selected_brand,
+        selected_model,
+        year_built,
+        distance_driven,
     )
 
     if st.button("Predict Price"):
         with st.spinner("Calculating..."):
             try:
-                ohe = OneHotEncoder(handle_unknown="ignore")
-                column_trans = make_column_transformer(
-                    (
-                        ohe,
-                        [
-                            "fuel",
-                            "seller_type",
-                            "transmission",
-                            "Brand",
-                            "Model",
-                            "previous_owners",
-                        ],
-                    ),
-                    remainder="passthrough",
-                )
-                X_train, X_test, y_train, y_test = train_test_split(
-                    X, y, test_size=0.2, random_state=42
-                )
-                rf = RandomForestRegressor(random_state=42)
-                pipe = make_pipeline(column_trans, rf)
-                pipe.fit(X_train, y_train)
-                pred = pipe.predict(input_data)
+                tail = (1 - int(range_width.rstrip("%")) / 100) / 2
+                pred, (low, high) = predict_one(input_row, quantiles=(tail, 1 - tail))
                 st.balloons()
-                st.success(f"Estimated Value: Rs {format_indian_number(pred[0])}")
+                st.success(f"Estimated Value: Rs {format_indian_number(pred)}")
+                st.info(
+                    f"Likely range: Rs {format_indian_number(low)} – "
+                    f"Rs {format_indian_number(high)} "
+                    f"(middle {range_width} of the model's tree estimates)"
+                )
             except Exception as e:
                 st.error(f"Prediction failed: {e}")
 
 
-elif page == "Explore Models":
+def explore_models_page():
+    import plotly.express as px
+
+    from options import get_option_index
+    from stats_cube import get_stats_cube
+
+    options = get_option_index()
+    cube = get_stats_cube()
     st.header("Explore Car Models")
-    selected_brands = st.multiselect("Select Brands", car["Brand"].unique())
+    selected_brands = st.multiselect("Select Brands", options.brands)
     if selected_brands:
-        filtered_models = car[car["Brand"].isin(selected_brands)]["Model"].unique()
+        filtered_models = [
+            model for brand in selected_brands for model in options.models(brand)
+        ]
         selected_models = st.multiselect("Select Models", filtered_models)
         if selected_models:
-            filtered_data = car[
-                (car["Brand"].isin(selected_brands))
-                & (car["Model"].isin(selected_models))
+            pairs = [
+                (brand, model)
+                for brand in selected_brands
+                for model in options.models(brand)
+                if model in selected_models
             ]
-            comparison_table = (
-                filtered_data.groupby(["Brand", "Model"])
-                .agg(
-                    avg_price=("Price", "mean"),
-                    min_price=("Price", "min"),
-                    max_price=("Price", "max"),
-                )
-                .reset_index()
-            )
+            comparison_table = cube.comparison(pairs)
             st.dataframe(comparison_table)
-            fig = px.bar(
-                filtered_data,
+            trend = cube.trend(pairs)
+            fig = px.line(
+                trend,
                 x="year_built",
-                y="Price",
+                y="avg_price",
                 color="Model",
+                markers=True,
+                hover_data=["count", "median_price", "min_price", "max_price"],
                 title="Price Trends Over the Years",
             )
             st.plotly_chart(fig, use_container_width=True)
@@ -373,13 +450,60 @@ elif page == "Explore Models":
         st.info("Select a brand to explore.")
 
 
-elif page == "Community":
+def batch_pricing_page():
+    from batch import BatchValidationError, price_csv
+    from prediction_cache import prediction_cache
+
+    st.header("Batch Pricing")
+    st.write(
+        "Upload a CSV of listings with the columns `fuel, seller_type, transmission, "
+        "previous_owners, Brand, Model, year_built, km_driven` to price them all at once."
+    )
+
+    listings = st.file_uploader("Upload Listings CSV", type=["csv"])
+    if listings is not None and st.button("Price Listings"):
+        progress = st.empty()
+        # Results are spooled to disk chunk by chunk instead of held in memory
+        output = tempfile.TemporaryFile(mode="w+", newline="")
+        try:
+            with st.spinner("Pricing listings..."):
+                summary = price_csv(
+                    listings,
+                    output,
+                    cache=prediction_cache,
+                    on_progress=lambda rows: progress.caption(f"Priced {rows} rows..."),
+                )
+        except BatchValidationError as e:
+            st.error(str(e))
+            return
+        except Exception as e:
+            st.error(f"Batch pricing failed: {e}")
+            return
+
+        progress.empty()
+        if summary["failed"]:
+            st.warning(
+                f"{summary['failed']} of {summary['rows']} rows could not be priced; "
+                "see the error column in the results."
+            )
+        else:
+            st.success(f"Priced {summary['rows']} listings.")
+        output.seek(0)
+        st.download_button(
+            "Download Priced CSV",
+            data=output,
+            file_name="priced_listings.csv",
+            mime="text/csv",
+        )
+
+
+def community_page():
     show_community_page()
     with st.expander("Upload Your Car"):
         upload_car_info()
 
 
-elif page == "About":
+def about_page():
     st.header("About PriceMyRide")
     st.write(
         """
@@ -396,3 +520,93 @@ elif page == "About":
     st.markdown("---")
     st.caption("© 2024 PriceMyRide. All rights reserved.")
 
+
+def metrics_page():
+    import pandas as pd
+
+    st.header("Metrics")
+    st.write("Timings and counters collected by this server process since it started.")
+    if not metrics.ENABLED:
+        st.info("Metrics are disabled (metrics=off).")
+        return
+
+    snapshot = metrics.registry.snapshot()
+    if snapshot["timers"]:
+        timers = pd.DataFrame(snapshot["timers"])
+        timers["labels"] = timers["labels"].map(
+            lambda labels: ", ".join(f"{key}={value}" for key, value in labels.items())
+        )
+        st.subheader("Timers")
+        st.dataframe(timers, hide_index=True)
+    if snapshot["counters"]:
+        counters = pd.DataFrame(snapshot["counters"])
+        counters["labels"] = counters["labels"].map(
+            lambda labels: ", ".join(f"{key}={value}" for key, value in labels.items())
+        )
+        st.subheader("Counters")
+        st.dataframe(counters, hide_index=True)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button(
+            "Prometheus text",
+            metrics.registry.to_prometheus(),
+            file_name="metrics.prom",
+            mime="text/plain",
+        )
+    with col2:
+        st.download_button(
+            "JSON",
+            metrics.registry.to_json(),
+            file_name="metrics.json",
+            mime="application/json",
+        )
+    with col3:
+        if st.button("Reset"):
+            metrics.registry.reset()
+            st.rerun()
+
+
+PAGES = {
+    "Home": home_page,
+    "Predictions": predictions_page,
+    "Explore Models": explore_models_page,
+    "Batch Pricing": batch_pricing_page,
+    "Community": community_page,
+    "About": about_page,
+}
+ADMIN_PAGES = {"Metrics": metrics_page}
+
+
+def _warm_up():
+    # Runs on a job thread in this process so the caches it fills are the
+    # ones the pages read
+    from model import load_model, model_ready
+    from options import get_option_index
+    from price_surface import load_surface
+    from stats_cube import get_stats_cube
+
+    for name in ("plotly.express", "batch", "uploads"):
+        importlib.import_module(name)
+    get_option_index()
+    get_stats_cube()
+    # A model that needs training is left to the Predictions page's job
+    if model_ready():
+        _, meta = load_model()
+        load_surface(meta["version"])
+
+
+def warm_up():
+    if WARMUP:
+        jobs.submit_io(_warm_up, key=("warm_up",), label="Warming up")
+
+
+def render():
+    warm_up()
+    render_header()
+    inject_style()
+    st.sidebar.subheader(f"Welcome {st.session_state.get('handle', 'User')}!")
+    pages = {**PAGES, **ADMIN_PAGES} if session.is_admin() else PAGES
+    page = st.sidebar.selectbox("Navigate to:", list(pages))
+    with metrics.timer("page_render_seconds", page=page):
+        pages[page]()